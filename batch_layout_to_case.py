@@ -0,0 +1,111 @@
+from argparse import ArgumentParser
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+
+from layout_to_case import build_parser, generate
+from py_keyboard_case.render import render_failed
+
+BatchJob = namedtuple('BatchJob', ['name', 'source', 'layout', 'argv'])
+BatchResult = namedtuple('BatchResult', ['name', 'seconds', 'error'])
+
+
+def directory_jobs(directory, argv):
+	jobs = []
+	for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+		name = os.path.splitext(os.path.basename(path))[0]
+		with open(path, 'r') as f:
+			jobs.append(BatchJob(name, path, f.read(), argv))
+	return jobs
+
+def jsonl_jobs(lines, argv):
+	# one object per line: {"layout": path} or {"kle": [...], "name": ...}, plus optional extra "args"
+	jobs = []
+	for line_num, line in enumerate(lines, 1):
+		if not line.strip():
+			continue
+		entry = json.loads(line)
+		if 'kle' in entry:
+			if 'name' not in entry:
+				raise ValueError(f"line {line_num}: inline kle layouts need a name")
+			source = f"<stdin:{line_num}>"
+			layout = json.dumps(entry['kle'])
+		elif 'layout' in entry:
+			source = entry['layout']
+			with open(source, 'r') as f:
+				layout = f.read()
+		else:
+			raise ValueError(f"line {line_num}: expected a 'layout' path or an inline 'kle' layout")
+		name = entry.get('name', os.path.splitext(os.path.basename(source))[0])
+		jobs.append(BatchJob(name, source, layout, argv + entry.get('args', [])))
+	return jobs
+
+def run_job(job):
+	# output of the run goes to output/<name>/batch.log instead of interleaving on stdout
+	start = time.perf_counter()
+	output_dir = os.path.join("output", job.name)
+	os.makedirs(output_dir, exist_ok=True)
+
+	with open(os.path.join(output_dir, "batch.log"), 'w') as log, redirect_stdout(log):
+		try:
+			args = build_parser().parse_args([job.source, job.name] + job.argv)
+			results = generate(args, job.layout)
+			error = "render failed" if render_failed(results) else None
+		except BaseException as e:
+			traceback.print_exc(file=log)
+			error = f"{type(e).__name__}: {e}"
+
+	return BatchResult(job.name, time.perf_counter() - start, error)
+
+def run_batch(jobs, workers=None):
+	names = [job.name for job in jobs]
+	duplicates = sorted(set(name for name in names if names.count(name) > 1))
+	if duplicates:
+		raise ValueError(f"output names must be unique, got duplicates {duplicates}")
+
+	results = []
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		futures = [pool.submit(run_job, job) for job in jobs]
+		for future in as_completed(futures):
+			result = future.result()
+			print(f"{result.seconds:8.2f}s  {'ok' if result.error is None else 'failed':8s} {result.name}", flush=True)
+			results.append(result)
+	return sorted(results, key=lambda result: result.name)
+
+def print_batch_summary(results, seconds):
+	failed = [result for result in results if result.error is not None]
+	print(f"\n{len(results)} layouts in {seconds:.2f}s, {len(failed)} failed")
+	for result in results:
+		print(f"{result.seconds:8.2f}s  {result.name}")
+	for result in failed:
+		print(f"failed {result.name}: {result.error} (see output/{result.name}/batch.log)")
+
+
+def main(argv=None):
+	parser = ArgumentParser(description="run layout_to_case over a directory of KLE files or a JSONL stream, any other flags are passed to every run")
+	parser.add_argument('source', type=str, help="directory of KLE .json files, or - to read JSONL from stdin")
+	parser.add_argument('--workers', type=int, default=None, help="number of layouts generated concurrently, defaults to the cpu count")
+	args, layout_argv = parser.parse_known_args(argv)
+
+	if args.source == "-":
+		jobs = jsonl_jobs(sys.stdin, layout_argv)
+	elif os.path.isdir(args.source):
+		jobs = directory_jobs(args.source, layout_argv)
+	else:
+		parser.error(f"{args.source} is not a directory")
+
+	start = time.perf_counter()
+	results = run_batch(jobs, workers=args.workers)
+	print_batch_summary(results, time.perf_counter() - start)
+
+	if any(result.error is not None for result in results):
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,225 @@
+from argparse import ArgumentParser
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from py_keyboard_case.key_table import KeyTable
+from py_keyboard_case.utils import U, key_list_corners, convex_hull, key_plate_footprint, key_plate_footprint_dual_acrylic_solid
+from py_keyboard_case.scad import UnionCollector, flatten_unions, scad_render_modules
+from py_keyboard_case.housing import Housing
+from py_keyboard_case.slicing import slice_solid
+from py_keyboard_case.mesh import layers_to_mesh
+from py_keyboard_case.pipeline import generate
+from py_keyboard_case.redox import BertoDoxPort, gen_key_midpoint_screw_point_location, redox_tight_square_elec_compartment_polygon
+from solid import scad_render
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+BUNDLED_LAYOUTS = ["redox", "berdox", "berdox_fn", "numpad"]
+
+# extra rows of 7+7 keys stacked on top of redox
+SYNTHETIC_LAYOUTS = {
+	"synthetic_redox_12": 12,
+	"synthetic_redox_48": 48,
+}
+
+
+def synthetic_layout(extra_rows):
+	# redox with extra rows above it, so the outline keeps the redox shape while the key count grows
+	with open(os.path.join(ROOT, "kle_layouts", "redox.json"), 'r') as f:
+		layout = json.load(f)
+	meta, rows = layout[:1], layout[1:]
+	for row in rows:
+		for item in row:
+			# rotation origins are absolute, move them down with the rest of the keys
+			if isinstance(item, dict) and 'ry' in item:
+				item['ry'] += extra_rows
+	extra = [["k"] * 7 + [{'x': 2.5}] + ["k"] * 7 for _ in range(extra_rows)]
+	return json.dumps(meta + extra + rows)
+
+def load_layouts(names):
+	layouts = {}
+	for name in names:
+		if name in SYNTHETIC_LAYOUTS:
+			layouts[name] = synthetic_layout(SYNTHETIC_LAYOUTS[name])
+		else:
+			with open(os.path.join(ROOT, "kle_layouts", f"{name}.json"), 'r') as f:
+				layouts[name] = f.read()
+	return layouts
+
+def outline(keys):
+	# the redox outline needs a rotated thumb cluster, other layouts get their convex hull
+	keys_filtered = keys[keys.x < 10]
+	if not (keys_filtered.rotation_angle == 30).any():
+		return convex_hull(key_list_corners(keys)) * U, None
+
+	keys_extent_verts = redox_tight_square_elec_compartment_polygon(keys_filtered)
+	mid_screw_point = gen_key_midpoint_screw_point_location(keys_filtered[keys_filtered.rotation_angle == 0])
+	return keys_extent_verts, mid_screw_point
+
+def key_footprints(keys):
+	footprints = UnionCollector()
+	for key in keys:
+		footprints += key_plate_footprint(key, footprint_fn=key_plate_footprint_dual_acrylic_solid)
+	return footprints.get_solid()
+
+def housing(verts, mid_screw_point, footprints):
+	aux_screw_points = [mid_screw_point] if mid_screw_point is not None else []
+	return Housing(verts, footprints, cavity_depth=4*3.175, plate_thickness=4.7625, port=BertoDoxPort(), aux_screw_points=aux_screw_points)
+
+def full_pipeline(layout, no_tilt=False):
+	output_dir = tempfile.mkdtemp(prefix="bench_")
+	try:
+		result = generate(layout, output_dir, rebuild=True, no_tilt=no_tilt)
+		return sum(os.path.getsize(filename) for filename in result.files)
+	finally:
+		shutil.rmtree(output_dir)
+
+
+def measure(fn, repeat):
+	# best wall time of `repeat` plain runs, then one traced run for the peak python allocation
+	seconds = math.inf
+	for _ in range(repeat):
+		start = time.perf_counter()
+		value = fn()
+		seconds = min(seconds, time.perf_counter() - start)
+
+	tracemalloc.start()
+	try:
+		fn()
+		_, peak = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+	return value, seconds, peak
+
+def output_bytes(value):
+	if isinstance(value, str):
+		return len(value.encode())
+	if isinstance(value, int):
+		return value
+	if hasattr(value, 'nbytes'):
+		return value.nbytes
+	return None
+
+def bench_layout(layout, repeat, stages=None, no_tilt=False):
+	# stages run in pipeline order, each one on the previous results
+	state = {}
+	steps = [
+		("kle_parse", lambda: KeyTable.from_kle(layout), 'keys'),
+		("outline", lambda: outline(state['keys']), 'outline'),
+		("key_footprints", lambda: key_footprints(state['keys']), 'footprints'),
+		("housing", lambda: housing(*state['outline'], state['footprints']), 'housing'),
+		("get_case_solid", lambda: state['housing'].get_case_solid(mode="laser", align="bottom"), 'case'),
+		("get_plate_solid", lambda: state['housing'].get_plate_solid(mode="laser"), 'plate'),
+		("slice_solid", lambda: slice_solid(state['case'], [3.175]*math.ceil(state['housing'].case.height/3.175), x_tile=300, y_tile=200, aspect_ratio=0.66), 'sliced'),
+		("get_case_layers", lambda: state['housing'].get_case_layers(mode="laser", align="bottom"), 'case_layers'),
+		("layers_to_mesh", lambda: layers_to_mesh(state['case_layers']), None),
+		("scad_render", lambda: scad_render(flatten_unions(state['case'])) + scad_render(flatten_unions(state['plate'])), None),
+		("scad_render_modules", lambda: scad_render_modules(state['case']) + scad_render_modules(state['plate']), None),
+		("full_pipeline", lambda: full_pipeline(layout, no_tilt=no_tilt), None),
+	]
+
+	results = {}
+	for name, fn, key in steps:
+		try:
+			value, seconds, peak = measure(fn, repeat if stages is None or name in stages else 1)
+		except Exception as e:
+			results[name] = {'error': f"{type(e).__name__}: {e}"}
+			if key is not None:
+				# everything after depends on this stage
+				break
+			continue
+		if key is not None:
+			state[key] = value
+		if stages is None or name in stages:
+			results[name] = {'seconds': seconds, 'peak_bytes': peak, 'output_bytes': output_bytes(value)}
+	return results
+
+def compare(results, baseline, time_tolerance, memory_tolerance, size_tolerance):
+	regressions = []
+	for layout, stages in results.items():
+		for stage, result in stages.items():
+			base = baseline.get(layout, {}).get(stage)
+			if base is None or 'error' in result or 'error' in base:
+				continue
+			# (metric, relative tolerance, absolute slack so sub-millisecond stages do not flag timer noise)
+			limits = [
+				('seconds', time_tolerance, 0.005),
+				('peak_bytes', memory_tolerance, 64 * 2**10),
+				('output_bytes', size_tolerance, 0),
+			]
+			for metric, tolerance, slack in limits:
+				if result[metric] is None or base.get(metric) is None:
+					continue
+				if result[metric] > base[metric] * (1 + tolerance) + slack:
+					regressions.append((layout, stage, metric, base[metric], result[metric]))
+	return regressions
+
+def print_results(results, baseline):
+	for layout, stages in results.items():
+		print(layout)
+		for stage, result in stages.items():
+			if 'error' in result:
+				print(f"  {stage:20s} {result['error']}")
+				continue
+			base = baseline.get(layout, {}).get(stage, {})
+			change = ""
+			if base.get('seconds'):
+				change = f"{100 * (result['seconds'] / base['seconds'] - 1):+6.1f}%"
+			size = f"{result['output_bytes']:>10d} B" if result['output_bytes'] is not None else ""
+			print(f"  {stage:20s} {result['seconds']:8.3f}s {change:8s} {result['peak_bytes'] / 2**20:8.1f} MB peak {size}")
+
+
+def main(argv=None):
+	parser = ArgumentParser(description="time every pipeline stage over the bundled and synthetic layouts and compare against baseline.json")
+	parser.add_argument('--layouts', nargs='+', default=BUNDLED_LAYOUTS + list(SYNTHETIC_LAYOUTS))
+	parser.add_argument('--stages', nargs='+', default=None, help="only report these stages, earlier ones still run once to feed them")
+	parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage, the best is kept")
+	parser.add_argument('--update', action="store_true", help="store these results as the new baseline")
+	parser.add_argument('--time_tolerance', type=float, default=0.25)
+	parser.add_argument('--memory_tolerance', type=float, default=0.10)
+	parser.add_argument('--size_tolerance', type=float, default=0.01)
+	parser.add_argument('--output', type=str, default=None, help="also write the results to this json file")
+	args = parser.parse_args(argv)
+
+	baseline = {}
+	if os.path.exists(BASELINE_FILE):
+		with open(BASELINE_FILE, 'r') as f:
+			baseline = json.load(f)
+
+	results = {}
+	for name, layout in load_layouts(args.layouts).items():
+		# the tilt mounts are placed on redox outline faces that the synthetic layouts do not have
+		results[name] = bench_layout(layout, args.repeat, stages=args.stages, no_tilt=name in SYNTHETIC_LAYOUTS)
+
+	print_results(results, baseline)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent=1)
+
+	if args.update:
+		for name, stages in results.items():
+			baseline.setdefault(name, {}).update(stages)
+		with open(BASELINE_FILE, 'w') as f:
+			json.dump(baseline, f, indent=1, sort_keys=True)
+			f.write("\n")
+		return
+
+	regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance, args.size_tolerance)
+	for layout, stage, metric, base, value in regressions:
+		print(f"REGRESSION {layout} {stage} {metric}: {base:.4g} -> {value:.4g}")
+	if regressions:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
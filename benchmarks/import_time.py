@@ -0,0 +1,74 @@
+from argparse import ArgumentParser
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_budget.json")
+
+MODULES = [
+	"layout_to_case",
+	"py_keyboard_case.cache",
+	"py_keyboard_case.stages",
+	"py_keyboard_case.render",
+	"py_keyboard_case.key_table",
+	"py_keyboard_case.export",
+	"py_keyboard_case.layers",
+	"py_keyboard_case.mesh",
+	"py_keyboard_case.scad",
+	"py_keyboard_case.utils",
+	"py_keyboard_case.housing",
+]
+
+
+def import_time(module):
+	# cumulative microseconds python -X importtime reports for `module` in a fresh interpreter
+	proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+		cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+	for line in reversed(proc.stderr.splitlines()):
+		if not line.startswith("import time:"):
+			continue
+		_, cumulative, name = line[len("import time:"):].split("|")
+		if name.strip() == module:
+			return int(cumulative)
+	raise ValueError(f"no import time reported for {module}")
+
+def measure(modules, repeat=5):
+	return {module: statistics.median(import_time(module) for _ in range(repeat)) / 1000 for module in modules}
+
+
+def main(argv=None):
+	parser = ArgumentParser(description="check the cold import time of each module against import_budget.json")
+	parser.add_argument('--repeat', type=int, default=5, help="fresh interpreters per module, the median is used")
+	parser.add_argument('--update', action="store_true", help="write the measured times times --headroom as the new budget")
+	parser.add_argument('--headroom', type=float, default=1.5)
+	args = parser.parse_args(argv)
+
+	times = measure(MODULES, repeat=args.repeat)
+
+	if args.update:
+		budget = {module: round(ms * args.headroom, 1) for module, ms in times.items()}
+		with open(BUDGET_FILE, 'w') as f:
+			json.dump(budget, f, indent=1)
+			f.write("\n")
+
+	with open(BUDGET_FILE, 'r') as f:
+		budget = json.load(f)
+
+	over = []
+	for module, ms in times.items():
+		limit = budget.get(module)
+		status = "no budget" if limit is None else ("ok" if ms <= limit else "OVER")
+		print(f"{ms:8.1f}ms  / {limit if limit is not None else '-':>7} ms  {status:9s} {module}")
+		if limit is not None and ms > limit:
+			over.append(module)
+
+	if over:
+		print(f"{len(over)} modules over their import budget")
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,182 @@
+from argparse import ArgumentParser
+import base64
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import importlib
+import json
+import os
+import socketserver
+import threading
+import time
+
+from py_keyboard_case.cache import content_hash
+from py_keyboard_case.pipeline import generate
+from py_keyboard_case.stages import StageMemory
+
+
+def request_options(request):
+	# generation options of a request, everything that changes the written files
+	name = request.get('name')
+	if not isinstance(name, str) or not name or name in (".", "..") or os.sep in name or "/" in name:
+		raise ValueError("'name' must be a plain directory name")
+
+	if 'kle' in request:
+		layout = json.dumps(request['kle'])
+	elif 'layout' in request:
+		layout = request['layout']
+	else:
+		raise ValueError("expected an inline 'kle' layout or 'layout' json text")
+
+	options = {
+		'name': name,
+		'layout': layout,
+		'housing': request.get('housing') or {},
+		'sheets': request.get('sheets') or {},
+		'no_tilt': bool(request.get('no_tilt', False)),
+		'slice_plate_top': bool(request.get('slice_plate_top', False)),
+		'modules': bool(request.get('modules', True)),
+		'resolution': request.get('resolution', "production"),
+	}
+	return options
+
+
+class LayoutService:
+	# keeps stage values warm in memory between requests and coalesces identical concurrent requests
+	def __init__(self, output_root="output", memory_entries=64):
+		self.output_root = output_root
+		self.memory = StageMemory(max_entries=memory_entries)
+		self.inflight = {}
+		self.inflight_lock = threading.Lock()
+		# stage memory and output directories are shared, so generation itself runs one at a time
+		self.generate_lock = threading.Lock()
+
+	def warm_up(self):
+		# the geometry modules the stages import lazily, loaded once before the first request
+		for module in ("py_keyboard_case.housing", "py_keyboard_case.slicing", "py_keyboard_case.export"):
+			importlib.import_module(module)
+
+	def generate(self, options):
+		key = content_hash(json.dumps(options, sort_keys=True))
+		with self.inflight_lock:
+			future = self.inflight.get(key)
+			owner = future is None
+			if owner:
+				future = Future()
+				self.inflight[key] = future
+
+		if not owner:
+			return future.result(), True
+
+		try:
+			with self.generate_lock:
+				result = generate(options['layout'], os.path.join(self.output_root, options['name']),
+					housing=options['housing'], sheets=options['sheets'], no_tilt=options['no_tilt'],
+					slice_plate_top=options['slice_plate_top'], modules=options['modules'],
+					resolution=options['resolution'], memory=self.memory)
+			future.set_result(result)
+		except BaseException as e:
+			future.set_exception(e)
+			raise
+		finally:
+			with self.inflight_lock:
+				del self.inflight[key]
+
+		return result, False
+
+	def handle(self, request):
+		start = time.perf_counter()
+		options = request_options(request)
+		result, coalesced = self.generate(options)
+
+		files = {os.path.basename(filename): filename for filename in result.files}
+		artifacts = {}
+		for name in request.get('artifacts', []):
+			if name not in files:
+				raise ValueError(f"unknown artifact '{name}', expected one of {sorted(files)}")
+			with open(files[name], 'rb') as f:
+				artifacts[name] = base64.b64encode(f.read()).decode()
+
+		return {
+			'name': options['name'],
+			'files': sorted(files),
+			'seconds': time.perf_counter() - start,
+			'coalesced': coalesced,
+			'stages': result.stages,
+			'violations': result.violations,
+			'artifacts': artifacts,
+		}
+
+
+class LayoutRequestHandler(BaseHTTPRequestHandler):
+	service = None
+
+	def address_string(self):
+		# unix socket clients have no address
+		return self.client_address[0] if self.client_address else "unix"
+
+	def send_json(self, status, body):
+		data = json.dumps(body).encode()
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def do_GET(self):
+		if self.path == "/health":
+			self.send_json(200, {'status': "ok"})
+		else:
+			self.send_json(404, {'error': f"unknown path {self.path}"})
+
+	def do_POST(self):
+		if self.path != "/generate":
+			self.send_json(404, {'error': f"unknown path {self.path}"})
+			return
+
+		try:
+			length = int(self.headers.get("Content-Length", 0))
+			request = json.loads(self.rfile.read(length))
+			self.send_json(200, self.service.handle(request))
+		except (ValueError, TypeError, AttributeError) as e:
+			self.send_json(400, {'error': str(e)})
+		except Exception as e:
+			self.send_json(500, {'error': f"{type(e).__name__}: {e}"})
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+	daemon_threads = True
+
+
+def main(argv=None):
+	parser = ArgumentParser(description="serve layout_to_case generation over localhost http or a unix socket")
+	parser.add_argument('--host', type=str, default="127.0.0.1")
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--socket', type=str, default=None, help="listen on this unix socket instead of host:port")
+	parser.add_argument('--output_root', type=str, default="output")
+	parser.add_argument('--memory_entries', type=int, default=64, help="stage values kept in memory")
+	args = parser.parse_args(argv)
+
+	service = LayoutService(output_root=args.output_root, memory_entries=args.memory_entries)
+	service.warm_up()
+	handler = type("Handler", (LayoutRequestHandler,), {'service': service})
+
+	if args.socket is not None:
+		if os.path.exists(args.socket):
+			os.remove(args.socket)
+		server = UnixHTTPServer(args.socket, handler)
+		print(f"listening on {args.socket}")
+	else:
+		server = ThreadingHTTPServer((args.host, args.port), handler)
+		print(f"listening on http://{args.host}:{args.port}")
+
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		if args.socket is not None and os.path.exists(args.socket):
+			os.remove(args.socket)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,151 @@
+from contextlib import contextmanager
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+from py_keyboard_case.instrument import instrument
+
+
+def content_hash(*parts):
+	h = hashlib.sha256()
+	for part in parts:
+		if isinstance(part, str):
+			part = part.encode()
+		h.update(part)
+		h.update(b'\0')
+	return h.hexdigest()
+
+def file_hash(filename):
+	h = hashlib.sha256()
+	with open(filename, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+def same_content(a, b, chunk_size=1 << 16):
+	if not os.path.exists(a) or not os.path.exists(b) or os.path.getsize(a) != os.path.getsize(b):
+		return False
+	with open(a, 'rb') as fa, open(b, 'rb') as fb:
+		while True:
+			chunk = fa.read(chunk_size)
+			if chunk != fb.read(chunk_size):
+				return False
+			if not chunk:
+				return True
+
+def atomic_write(filename, data):
+	# readers (and a build killed half way) never see a partially written file
+	tmp_path = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+	try:
+		with open(tmp_path, 'wb') as f:
+			f.write(data)
+		os.replace(tmp_path, filename)
+	except BaseException:
+		os.remove(tmp_path)
+		raise
+
+@instrument()
+def write_if_changed(filename, content):
+	# leave the file (and its mtime) alone when the content is already there
+	data = content.encode() if isinstance(content, str) else content
+	if os.path.exists(filename) and os.path.getsize(filename) == len(data):
+		if file_hash(filename) == hashlib.sha256(data).hexdigest():
+			return False
+
+	atomic_write(filename, data)
+	return True
+
+@contextmanager
+def streamed_write(filename, compress=False):
+	# text handle writing straight into a tmp file, moved into place once the block finishes unless
+	# the file already holds the same bytes, like write_if_changed. compress writes a reproducible gzip stream
+	tmp_path = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+	try:
+		with open(tmp_path, 'wb', buffering=1 << 16) as raw:
+			binary = gzip.GzipFile(filename='', mode='wb', fileobj=raw, mtime=0) if compress else raw
+			with io.TextIOWrapper(binary, encoding='utf-8', newline='') as text:
+				yield text
+
+		if same_content(filename, tmp_path):
+			os.remove(tmp_path)
+		else:
+			os.replace(tmp_path, filename)
+	except BaseException:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+		raise
+
+
+class ArtifactCache:
+	# content addressed store of rendered files, evicting least recently used entries past max_bytes
+	def __init__(self, directory, max_bytes=1 << 30):
+		self.directory = directory
+		self.max_bytes = max_bytes
+		os.makedirs(self.directory, exist_ok=True)
+
+	def path(self, key, ext):
+		return os.path.join(self.directory, key[:2], key + ext)
+
+	def get(self, key, ext):
+		path = self.path(key, ext)
+		if not os.path.exists(path):
+			return None
+		# mtime doubles as the last use time for eviction
+		os.utime(path)
+		return path
+
+	def fetch(self, key, ext, destination):
+		path = self.get(key, ext)
+		if path is None:
+			return False
+		try:
+			# an output that already matches keeps its mtime, like write_if_changed
+			if not same_content(path, destination):
+				shutil.copyfile(path, destination)
+		except FileNotFoundError:
+			return False
+		return True
+
+	def put(self, key, ext, source):
+		path = self.path(key, ext)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+
+		fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+		os.close(fd)
+		shutil.copyfile(source, tmp_path)
+		os.replace(tmp_path, path)
+
+		self.evict()
+		return path
+
+	def entries(self):
+		entries = []
+		for root, _, files in os.walk(self.directory):
+			for name in files:
+				path = os.path.join(root, name)
+				try:
+					stat = os.stat(path)
+				except FileNotFoundError:
+					# evicted by another process sharing the cache
+					continue
+				entries.append((stat.st_mtime, stat.st_size, path))
+		return entries
+
+	def size(self):
+		return sum(size for _, size, _ in self.entries())
+
+	def evict(self):
+		entries = sorted(self.entries())
+		total = sum(size for _, size, _ in entries)
+		for _, size, path in entries:
+			if total <= self.max_bytes:
+				break
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+			total -= size
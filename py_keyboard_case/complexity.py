@@ -0,0 +1,171 @@
+import json
+import os
+
+from py_keyboard_case.cache import write_if_changed
+from py_keyboard_case.layers import circle_fragments
+from py_keyboard_case.scad import _hash_tree
+
+
+BOOLEAN_OPS = ('union', 'difference', 'intersection', 'hull', 'minkowski')
+
+METRICS = ('nodes', 'depth', 'booleans', 'primitives', 'vertices', 'segments', 'facets', 'cost')
+
+# rotate_extrude has no radius to derive fragments from, assume OpenSCAD's $fa limit
+ROTATE_EXTRUDE_FRAGMENTS = 30
+
+PRIMITIVES_2D = ('circle', 'square', 'polygon', 'text')
+
+
+def _radius(params, name):
+	r = params.get(name)
+	if r is None and params.get('d' + name[1:]) is not None:
+		r = params['d' + name[1:]] / 2
+	return r
+
+def _segments(params):
+	return params.get('segments', params.get('$fn'))
+
+def _primitive(node):
+	# (facets, vertices, segments) of a leaf. 2D shapes count edges as facets
+	params = node.params
+	name = node.name
+	if name == 'cube':
+		return 6, 8, 0
+	if name == 'cylinder':
+		r1 = _radius(params, 'r1')
+		r2 = _radius(params, 'r2')
+		r = _radius(params, 'r') or 1
+		n = circle_fragments(max(r1 if r1 is not None else r, r2 if r2 is not None else r), _segments(params))
+		return n + 2, 2 * n, n
+	if name == 'sphere':
+		n = circle_fragments(_radius(params, 'r') or 1, _segments(params))
+		rings = (n + 1) // 2
+		return n * rings, n * rings, n
+	if name == 'circle':
+		n = circle_fragments(_radius(params, 'r') or 1, _segments(params))
+		return n, n, n
+	if name == 'square':
+		return 4, 4, 0
+	if name == 'polygon':
+		n = len(params.get('points') or [])
+		return n, n, 0
+	if name == 'polyhedron':
+		return len(params.get('faces') or []), len(params.get('points') or []), 0
+	return 0, 0, 0
+
+def csg_metrics(solid):
+	# static size of a SolidPython tree, walked bottom up without recursion:
+	#   booleans  union/difference/intersection/hull/minkowski nodes plus hole() subtractions
+	#   vertices  polygon and primitive vertices, segments summed cylinder/circle fragments
+	#   facets    estimated facets of the evaluated result
+	#   cost      facets fed into boolean operations and cut projections, the bulk of a CGAL render.
+	#             Identical subtrees count once, OpenSCAD caches their geometry. 2D booleans are left
+	#             out, OpenSCAD runs them on polygons with Clipper rather than through CGAL
+	keys, _, _ = _hash_tree(solid)
+	facets = {}
+	depths = {}
+	is_2d = {}
+	totals = dict.fromkeys(METRICS, 0)
+	costed = set()
+
+	stack = [(solid, False)]
+	while stack:
+		node, children_done = stack.pop()
+		if not children_done:
+			stack.append((node, True))
+			stack.extend((child, False) for child in node.children)
+			continue
+
+		totals['nodes'] += 1
+		child_facets = [facets[id(child)] for child in node.children]
+		depths[id(node)] = 1 + max((depths[id(child)] for child in node.children), default=0)
+		if not node.children:
+			is_2d[id(node)] = node.name in PRIMITIVES_2D
+		elif node.name in ('linear_extrude', 'rotate_extrude'):
+			is_2d[id(node)] = False
+		elif node.name == 'projection':
+			is_2d[id(node)] = True
+		else:
+			is_2d[id(node)] = all(is_2d[id(child)] for child in node.children)
+
+		cost = 0
+		if not node.children:
+			node_facets, vertices, segments = _primitive(node)
+			totals['primitives'] += 1
+			totals['vertices'] += vertices
+			totals['segments'] += segments
+		elif node.name == 'minkowski':
+			node_facets = 1
+			for child in child_facets:
+				node_facets *= max(child, 1)
+			cost = node_facets
+		elif node.name in BOOLEAN_OPS:
+			node_facets = sum(child_facets)
+			if len(node.children) > 1 and not is_2d[id(node)]:
+				cost = node_facets
+		elif node.name == 'linear_extrude':
+			# side walls plus two triangulated caps
+			node_facets = 3 * sum(child_facets)
+		elif node.name == 'rotate_extrude':
+			node_facets = ROTATE_EXTRUDE_FRAGMENTS * sum(child_facets)
+		elif node.name == 'projection':
+			node_facets = sum(child_facets)
+			cost = node_facets
+		else:
+			node_facets = sum(child_facets)
+
+		if node.name in BOOLEAN_OPS and len(node.children) > 1:
+			totals['booleans'] += 1
+		if node.is_hole:
+			# subtracted from the enclosing part
+			totals['booleans'] += 1
+			cost += node_facets
+
+		if cost and keys[id(node)] not in costed:
+			costed.add(keys[id(node)])
+			totals['cost'] += cost
+
+		facets[id(node)] = node_facets
+
+	totals['depth'] = depths[id(solid)]
+	totals['facets'] = facets[id(solid)]
+	return totals
+
+def metrics_path(scad_filename):
+	directory, name = os.path.split(scad_filename)
+	return os.path.join(directory, ".metrics", name + ".json")
+
+def write_metrics(scad_filename, solid):
+	path = metrics_path(scad_filename)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	write_if_changed(path, json.dumps(csg_metrics(solid), indent=1))
+
+def read_metrics(scad_filename):
+	path = metrics_path(scad_filename)
+	if not os.path.exists(path):
+		return None
+	with open(path, 'r') as f:
+		return json.load(f)
+
+def load_budgets(filename):
+	# {"warn": {"cost": ...}, "fail": {"booleans": ...}}, limits are on csg_metrics values
+	with open(filename, 'r') as f:
+		budgets = json.load(f)
+	for level in budgets:
+		if level not in ('warn', 'fail'):
+			raise ValueError(f"budget level must be 'warn' or 'fail', got '{level}'")
+		for metric in budgets[level]:
+			if metric not in METRICS:
+				raise ValueError(f"unknown budget metric '{metric}', expected one of {METRICS}")
+	return budgets
+
+def check_budgets(metrics, budgets):
+	# returns (warnings, failures) as lists of (metric, value, limit)
+	over = {}
+	for level in ('warn', 'fail'):
+		over[level] = [(metric, metrics[metric], limit) for metric, limit in budgets.get(level, {}).items() if metrics[metric] > limit]
+	return over['warn'], over['fail']
+
+def print_metrics(name, metrics):
+	print(f"{metrics['cost']:>12,d} cost  {metrics['booleans']:6d} booleans  {metrics['depth']:4d} deep  "
+		f"{metrics['vertices']:8d} vertices  {metrics['segments']:7d} segments  {name}")
@@ -0,0 +1,198 @@
+import os
+import re
+
+import numpy as np
+
+from py_keyboard_case.cache import write_if_changed
+from py_keyboard_case.instrument import instrument
+
+
+def geometry_polygons(geometry):
+	if geometry.is_empty:
+		return []
+	if geometry.geom_type == 'Polygon':
+		return [geometry]
+	if hasattr(geometry, 'geoms'):
+		return [polygon for part in geometry.geoms for polygon in geometry_polygons(part)]
+	return []
+
+def geometry_rings(geometry):
+	# every exterior and interior ring as an (N,2) array, without the repeated closing vertex
+	rings = []
+	for polygon in geometry_polygons(geometry):
+		for ring in [polygon.exterior, *polygon.interiors]:
+			rings.append(np.asarray(ring.coords)[:-1, :2])
+	return rings
+
+def write_svg(filename, geometry, margin=1, stroke_width=0.1, bounds=None):
+	# the drawing covers `bounds` (min_x, min_y, max_x, max_y) when given, else the geometry
+	if bounds is not None:
+		min_x, min_y, max_x, max_y = bounds
+	else:
+		min_x, min_y, max_x, max_y = geometry.bounds if not geometry.is_empty else (0, 0, 0, 0)
+
+	# svg y runs down, flip so the cut matches the model seen from above
+	path = ""
+	for ring in geometry_rings(geometry):
+		points = " L ".join(f"{x:.4f} {max_y + min_y - y:.4f}" for x, y in ring)
+		path += f"M {points} Z "
+
+	min_x, min_y = min_x - margin, min_y - margin
+	width = max_x - min_x + margin
+	height = max_y - min_y + margin
+
+	svg = '<?xml version="1.0" encoding="UTF-8"?>\n'
+	svg += (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.4f}mm" height="{height:.4f}mm" '
+		f'viewBox="{min_x:.4f} {min_y:.4f} {width:.4f} {height:.4f}">\n')
+	svg += f'<path d="{path.strip()}" fill="none" fill-rule="evenodd" stroke="black" stroke-width="{stroke_width}"/>\n'
+	svg += '</svg>\n'
+
+	write_if_changed(filename, svg)
+
+# polylines steeper than this per vertex are corners, not circle approximations
+MAX_ARC_STEP = np.pi / 6
+
+def _circle(a, b, c):
+	# center and radius of the circle through three points, None when they are collinear
+	d = 2 * (a[0]*(b[1] - c[1]) + b[0]*(c[1] - a[1]) + c[0]*(a[1] - b[1]))
+	if abs(d) < 1e-12:
+		return None
+	a2, b2, c2 = a @ a, b @ b, c @ c
+	center = np.array([
+		(a2*(b[1] - c[1]) + b2*(c[1] - a[1]) + c2*(a[1] - b[1])) / d,
+		(a2*(c[0] - b[0]) + b2*(a[0] - c[0]) + c2*(b[0] - a[0])) / d,
+	])
+	return center, np.hypot(*(a - center))
+
+def _arc_sweep(points, tolerance):
+	# signed angle swept by `points` if they all lie on one circle within tolerance, going
+	# around it in one direction in small steps, else None
+	circle = _circle(points[0], points[len(points) // 3], points[2 * len(points) // 3])
+	if circle is None:
+		return None
+	center, r = circle
+	offsets = points - center
+	if np.abs(np.hypot(offsets[:, 0], offsets[:, 1]) - r).max() > tolerance:
+		return None
+
+	steps = np.diff(np.unwrap(np.arctan2(offsets[:, 1], offsets[:, 0])))
+	if not (np.all(steps > 0) or np.all(steps < 0)) or np.abs(steps).max() > MAX_ARC_STEP:
+		return None
+	return steps.sum()
+
+def fit_arcs(ring, tolerance, min_points=4):
+	# (x, y, bulge) vertices of a closed ring: every run of at least min_points vertices on a
+	# common circle becomes one vertex whose bulge, tan(sweep / 4), draws the arc to the next one
+	n = len(ring)
+	closed = np.vstack((ring, ring[:1]))
+
+	sweep = _arc_sweep(closed, tolerance) if n >= min_points else None
+	if sweep is not None:
+		# a full circle, as two half arcs
+		half = n // 2
+		first = _arc_sweep(closed[:half + 1], tolerance)
+		return [(*ring[0], np.tan(first / 4)), (*ring[half], np.tan((sweep - first) / 4))]
+
+	# start on the sharpest corner so no arc is split by the ring's seam
+	edges = np.diff(closed, axis=0)
+	headings = np.arctan2(edges[:, 1], edges[:, 0])
+	turns = np.abs(np.angle(np.exp(1j * (headings - np.roll(headings, 1)))))
+	start = int(np.argmax(turns))
+	ring = np.roll(ring, -start, axis=0)
+	closed = np.vstack((ring, ring[:1]))
+
+	vertices = []
+	i = 0
+	while i < n:
+		end = i + min_points - 1
+		if end > n or _arc_sweep(closed[i:end + 1], tolerance) is None:
+			vertices.append((*ring[i], 0.0))
+			i += 1
+			continue
+
+		while end < n and _arc_sweep(closed[i:end + 2], tolerance) is not None:
+			end += 1
+		sweep = _arc_sweep(closed[i:end + 1], tolerance)
+		if abs(sweep) > np.pi:
+			# bulges get unwieldy past a half circle, split the arc at its middle vertex
+			middle = (i + end) // 2
+			first = _arc_sweep(closed[i:middle + 1], tolerance) if middle - i >= 2 else None
+			if first is not None and _arc_sweep(closed[middle:end + 1], tolerance) is not None:
+				vertices += [(*ring[i], np.tan(first / 4)), (*ring[middle], np.tan((sweep - first) / 4))]
+				i = end
+				continue
+		vertices.append((*ring[i], np.tan(sweep / 4)))
+		i = end
+
+	return vertices
+
+def write_dxf(filename, geometry, arc_tolerance=None):
+	# minimal R12 (AC1009) dxf, one closed POLYLINE per ring. R12 has no $INSUNITS, coordinates
+	# are in mm and have to be imported as such. With arc_tolerance, runs of vertices on a circle
+	# are written as bulged arcs instead of their polyline approximation
+	dxf = ["0\nSECTION\n2\nHEADER\n9\n$ACADVER\n1\nAC1009\n0\nENDSEC\n", "0\nSECTION\n2\nENTITIES\n"]
+	for ring in geometry_rings(geometry):
+		dxf.append("0\nPOLYLINE\n8\n0\n66\n1\n10\n0.0\n20\n0.0\n30\n0.0\n70\n1\n")
+		if arc_tolerance is None:
+			for x, y in ring:
+				dxf.append(f"0\nVERTEX\n8\n0\n10\n{x:.6f}\n20\n{y:.6f}\n30\n0.0\n")
+		else:
+			for x, y, bulge in fit_arcs(ring, arc_tolerance):
+				dxf.append(f"0\nVERTEX\n8\n0\n10\n{x:.6f}\n20\n{y:.6f}\n30\n0.0\n")
+				if bulge:
+					dxf.append(f"42\n{bulge:.6f}\n")
+		dxf.append("0\nSEQEND\n8\n0\n")
+	dxf.append("0\nENDSEC\n0\nEOF\n")
+
+	write_if_changed(filename, "".join(dxf))
+
+def layer_cut_heights(layer_thicknesses, slice_mode="bottom", jitter_dist=0.01):
+	# same cut planes slice_solid + projection(cut=True) use
+	assert slice_mode == "bottom" or slice_mode == "top", "slice mode must be either bottom or top"
+	z = 0
+	heights = []
+	for layer_thickness in layer_thicknesses:
+		if slice_mode == "bottom":
+			heights.append(z + jitter_dist)
+		else:
+			heights.append(z + layer_thickness - jitter_dist)
+		z += layer_thickness
+	return heights
+
+def layer_outlines(layers, layer_thicknesses, **kwargs):
+	return [layers.outline_at(z) for z in layer_cut_heights(layer_thicknesses, **kwargs)]
+
+@instrument()
+def laser_write_layers(layers, output_dir, name, layer_thicknesses, formats=('svg', 'dxf'), arc_tolerance=None, groups=None, **kwargs):
+	# with `groups` (see slicing.layer_groups) only the first layer of each group is written
+	indices = [group[0] for group in groups] if groups is not None else range(len(layer_thicknesses))
+	outlines = layer_outlines(layers, layer_thicknesses, **kwargs)
+	filenames = []
+	for i in indices:
+		for fmt in formats:
+			filename = os.path.join(output_dir, f"laser_{name}_{i}.{fmt}")
+			write_cut(filename, outlines[i], arc_tolerance=arc_tolerance)
+			filenames.append(filename)
+	remove_numbered(output_dir, f"laser_{name}", formats, filenames)
+	return filenames
+
+def remove_numbered(output_dir, prefix, formats, keep):
+	# <prefix>_<n>.<fmt> files an earlier run wrote that are not in `keep`, e.g. a layer that has
+	# since become a duplicate or a sheet no longer needed
+	pattern = re.compile(rf"{re.escape(prefix)}_\d+\.({'|'.join(map(re.escape, formats))})")
+	keep = {os.path.basename(filename) for filename in keep}
+	for entry in os.listdir(output_dir):
+		if pattern.fullmatch(entry) and entry not in keep:
+			os.remove(os.path.join(output_dir, entry))
+
+def write_cut(filename, geometry, arc_tolerance=None, bounds=None):
+	# svg or dxf by extension. An svg with bounds covers exactly those, e.g. a whole sheet
+	if filename.endswith(".svg"):
+		if bounds is not None:
+			write_svg(filename, geometry, margin=0, bounds=bounds)
+		else:
+			write_svg(filename, geometry)
+	elif filename.endswith(".dxf"):
+		write_dxf(filename, geometry, arc_tolerance=arc_tolerance)
+	else:
+		raise ValueError(f"unsupported laser format '{os.path.splitext(filename)[1]}'")
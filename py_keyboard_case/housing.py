@@ -0,0 +1,310 @@
+import copy
+import os
+
+import numpy as np
+import shapely
+from solid import color, difference, linear_extrude, offset, polygon, union
+from solid.utils import up, down
+from shapely.geometry import Polygon as ShapelyPolygon
+
+from py_keyboard_case.utils import get_shapely_exterior_array, array2tuples, geometry_to_polygon, place_along_face
+from py_keyboard_case.screws import M2Screw, M2Standoff
+from py_keyboard_case.port import Port
+from py_keyboard_case.scad import UnionCollector
+from py_keyboard_case.layers import LayeredSolid, solid_to_layers
+from py_keyboard_case.mesh import empty_mesh, layers_to_mesh, write_stl
+from py_keyboard_case.instrument import instrument
+from py_keyboard_case.resolution import segments_for_radius
+from py_keyboard_case.spatial import thin_points, space_along_ring
+
+
+# distance within which a screw point counts as on the midline ring
+ON_RING = 1e-6
+
+
+class Housing:
+	@instrument()
+	def __init__(
+		self,
+		key_extent_verts,
+		key_footprints,
+		plate_thickness=1.5,
+		cavity_depth=9.525,
+		cavity_border=-1.5,
+		wall_thickness=8,
+		port: Port=None,
+		aux_screw_points=[],
+		tilt_params=None,
+		screw_tolerances=None,
+		screw_min_spacing=0,
+		screw_max_spacing=None,
+		outline_tolerance=0,
+		outline_arcs=False):
+
+		self.key_footprints = key_footprints
+		self.plate_thickness = plate_thickness
+		self.cavity_depth = cavity_depth
+		self.cavity_border = cavity_border
+		self.wall_thickness = wall_thickness
+		self.screw_tolerances = screw_tolerances if screw_tolerances is not None else {'top': 'low', 'bottom': 'high'}
+		if screw_max_spacing is not None and screw_min_spacing > screw_max_spacing / 2:
+			raise ValueError("screw_min_spacing must be at most half of screw_max_spacing")
+		self.screw_min_spacing = screw_min_spacing
+		self.screw_max_spacing = screw_max_spacing
+		self.outline_tolerance = outline_tolerance
+
+		key_outline_polygon = ShapelyPolygon(key_extent_verts)
+		self.cavity_polygon = self.simplify(key_outline_polygon.buffer(self.cavity_border, cap_style=3, join_style=2))
+		self.midline_polygon = self.cavity_polygon.buffer(self.wall_thickness/2, cap_style=3, join_style=2)
+		outer_partial_polygon = self.simplify(self.midline_polygon.buffer(self.wall_thickness/4, cap_style=3, join_style=2))
+
+		corner_radius = self.wall_thickness/4
+		# a whole number of segments per quarter turn, so offset() and buffer() agree on the count
+		corner_segments = 4 * max(-(-segments_for_radius(corner_radius) // 4), 1)
+		self.outer_polygon = outer_partial_polygon.buffer(corner_radius, quad_segs=corner_segments // 4, cap_style=3, join_style=1)
+
+		# with outline_arcs the rounded corners are left to OpenSCAD's offset() instead of written out
+		# vertex by vertex, the layers path buffers the same polygon with the same segment count
+		outer_outline = None
+		if outline_arcs:
+			outer_outline = offset(r=corner_radius, segments=corner_segments)(polygon(array2tuples(get_shapely_exterior_array(outer_partial_polygon))))
+
+		self.outer_polygon_verts = get_shapely_exterior_array(self.outer_polygon)
+		self.cavity_polygon_verts = get_shapely_exterior_array(self.cavity_polygon)
+
+		self.screws = []
+		# LayeredSolid of the screws per mode, shared with the with_tilt copies
+		self.screw_layers = {}
+		# aux and port screw points are always used, perimeter points are thinned around them
+		fixed_screw_points = np.array(aux_screw_points, dtype=float).reshape(-1, 2)
+
+		self.port = port
+		if port is not None:
+			self.port.z = -self.cavity_depth
+			self.port.place_on_case_polygon(self.outer_polygon_verts, place_offset=self.wall_thickness, placement='top_left')
+			
+			port_side_screw_points = self.port.get_side_screw_points(x_offset=self.wall_thickness/2, y_offset= -self.wall_thickness/2)
+			fixed_screw_points = np.concatenate((fixed_screw_points, np.array(port_side_screw_points, dtype=float).reshape(-1, 2)), axis=0)
+
+		screw_points = self.get_screw_points(fixed_screw_points)
+
+		self.plate = Plate(self.outer_polygon_verts, self.key_footprints, height=self.plate_thickness, outline=outer_outline)
+		self.case = Case(self.outer_polygon_verts, self.cavity_polygon_verts, self.wall_thickness, self.cavity_depth, 3.175, port=self.port, tilt_params=tilt_params, outline=outer_outline)
+
+		self.place_screws(screw_points, placement="top")
+		self.place_screws(screw_points, placement="bottom")
+		self.place_standoffs(screw_points)
+
+	def with_tilt(self, tilt_params):
+		# same plate and screws, case rebuilt with a different set of tilt mounts
+		housing = copy.copy(self)
+		housing.case = Case(self.case.outer_polygon_verts, self.case.cavity_polygon_verts, self.case.wall_thickness,
+			self.case.cavity_depth, self.case.bottom_thickness, port=self.case.port, tilt_params=tilt_params, outline=self.case.outline)
+		return housing
+
+	def get_solid(self, mode='stl'):
+		return self.get_plate_solid(mode=mode), self.get_case_solid(mode=mode)
+
+	def get_blown_up_solid(self):
+		plate = self.get_plate_solid()
+		case = self.get_case_solid()
+
+		case = down(10)(case)
+
+		blown_up_solid = plate + case
+
+		return blown_up_solid
+
+	def get_screw_solids(self, mode='stl'):
+		return union()(*[screw.get_solid(mode=mode) for screw in self.screws])
+
+	def get_plate_solid(self, mode='stl'):
+		return self.plate.get_solid(mode=mode) - self.get_screw_solids(mode=mode)
+
+	def get_case_solid(self, mode = 'stl', align='top'):
+		case_solid = self.case.get_solid(mode=mode) - self.get_screw_solids(mode=mode)
+
+		if align == 'bottom':
+			case_solid = up(self.case.height)(case_solid)
+		
+		return case_solid
+
+	def get_layers(self, mode='stl'):
+		return self.get_plate_layers(mode=mode), self.get_case_layers(mode=mode)
+
+	def get_screw_layers(self, mode='stl'):
+		if mode not in self.screw_layers:
+			self.screw_layers[mode] = LayeredSolid.union_all([screw.get_layers(mode=mode) for screw in self.screws])
+		return self.screw_layers[mode]
+
+	def get_plate_layers(self, mode='stl'):
+		return self.plate.get_layers(mode=mode) - self.get_screw_layers(mode=mode)
+
+	def get_case_layers(self, mode='stl', align='top'):
+		case_layers = self.case.get_layers(mode=mode) - self.get_screw_layers(mode=mode)
+
+		if align == 'bottom':
+			case_layers = case_layers.translate([0, 0, self.case.height])
+
+		return case_layers
+
+	def get_screw_mesh(self, mode='stl'):
+		return np.concatenate([empty_mesh()] + [screw.get_mesh(mode=mode) for screw in self.screws])
+
+	def get_plate_mesh(self, mode='stl'):
+		return layers_to_mesh(self.get_plate_layers(mode=mode))
+
+	def get_case_mesh(self, mode='stl', align='top'):
+		return layers_to_mesh(self.get_case_layers(mode=mode, align=align))
+
+	def write_stl(self, output_dir, case_name="case", plate_name="plate", mode='stl'):
+		write_stl(os.path.join(output_dir, f"{case_name}.stl"), self.get_case_mesh(mode=mode))
+		write_stl(os.path.join(output_dir, f"{plate_name}.stl"), self.get_plate_mesh(mode=mode))
+
+	def simplify(self, polygon):
+		# outer and cavity outlines each move at most half the tolerance, so the wall
+		# thickness stays within outline_tolerance
+		if not self.outline_tolerance:
+			return polygon
+		return polygon.simplify(self.outline_tolerance/2, preserve_topology=True)
+
+	def get_screw_points(self, fixed_points=()):
+		# midline vertices with every point within screw_min_spacing of a fixed point or an earlier
+		# one merged into it, then topped up along the perimeter to screw_max_spacing. Spacing comes
+		# last so no merge can reopen a gap
+		ring = self.midline_polygon.exterior
+		# the ring repeats its first vertex at the end
+		points = np.array(ring.coords)[:-1]
+		fixed_points = np.asarray(fixed_points, dtype=float).reshape(-1, 2)
+
+		points = thin_points(np.concatenate((fixed_points, points), axis=0), self.screw_min_spacing, fixed=len(fixed_points))
+
+		if self.screw_max_spacing is not None:
+			# only points on the ring are perimeter screws, an interior one (e.g. a mid board aux
+			# screw) projected onto the ring would leave a gap there unspaced
+			on_ring = ring.distance(shapely.points(points)) < ON_RING
+			points = np.concatenate((space_along_ring(ring, points[on_ring], self.screw_max_spacing), points[~on_ring]), axis=0)
+
+		return points
+
+	def place_screws(self, screw_points, length=6, screw_class=M2Screw, placement="top"):
+
+		if placement == "top":
+			z = self.plate.height
+			rotation = [0,0,0]
+		elif  placement == "bottom":
+			z = -1 * self.case.height
+			rotation = [180, 0, 0]
+		else:
+			raise ValueError("invalid screw placement")
+
+		tolerance = self.screw_tolerances[placement]
+
+		for screw_point in screw_points:
+			screw = screw_class(length, position=[screw_point[0], screw_point[1], z], rotation=rotation, tolerance=tolerance)
+			self.screws.append(screw)
+
+	def place_standoffs(self, screw_points):
+		length = self.case.cavity_depth
+		for screw_point in screw_points:
+			screw = M2Standoff(length, position=[screw_point[0], screw_point[1], 0])
+			self.screws.append(screw) 
+
+
+class Plate:
+	def __init__(self, polygon_verts, key_footprints, height=1.5, outline=None):
+		self.polygon_verts = polygon_verts
+		self.key_footprints = key_footprints
+		self.height = height
+		# 2D solid of polygon_verts, e.g. with arcs left to offset(), the polygon itself by default
+		self.outline = outline
+		self.cutout_layers = None
+
+	def get_cutout_layers(self):
+		# key footprints as 2D slabs in plate coordinates, computed once
+		if self.cutout_layers is None:
+			self.cutout_layers = solid_to_layers(self.key_footprints).translate([0, 0, self.height])
+		return self.cutout_layers
+
+	def get_solid(self, mode='stl'):
+		# key cutouts are unioned in shapely and extruded as a polygon with holes, one per z range
+		# they are constant over, so OpenSCAD has no 3D boolean to do per key
+		cutouts = self.get_cutout_layers()
+		z_cuts = sorted({0, self.height} | {z for slab in cutouts for z in (slab.z_min, slab.z_max) if 0 < z < self.height})
+
+		plate = UnionCollector()
+		for z_min, z_max in zip(z_cuts, z_cuts[1:]):
+			cut = cutouts.outline_at((z_min + z_max) / 2)
+			if self.outline is None:
+				layer = geometry_to_polygon(ShapelyPolygon(self.polygon_verts).difference(cut))
+			else:
+				# keeps the arcs of the outline, at the price of one 2D difference
+				holes = geometry_to_polygon(cut)
+				layer = difference()(self.outline, holes) if holes is not None else self.outline
+			if layer is not None:
+				plate += up(z_min)(linear_extrude(z_max - z_min, convexity=10)(layer))
+
+		return color([0,0,0])(plate.get_solid())
+
+	def get_layers(self, mode='stl'):
+		plate = LayeredSolid.extrude(ShapelyPolygon(self.polygon_verts), 0, self.height)
+		return plate - self.get_cutout_layers()
+
+
+class Case:
+	def __init__(self, outer_polygon_verts, cavity_polygon_verts, wall_thickness, cavity_depth, bottom_thickness, port=None, tilt_params=None, outline=None):
+		self.outer_polygon_verts = outer_polygon_verts
+		self.outline = outline
+		self.cavity_polygon_verts = cavity_polygon_verts
+		self.wall_thickness = wall_thickness
+		self.cavity_depth = cavity_depth
+		self.bottom_thickness = bottom_thickness
+		self.port = port
+
+		self.height = self.cavity_depth + self.bottom_thickness
+
+		self.tilt_mounts = []
+		if tilt_params is not None:
+			for tilt_class, face_num, placement, place_mode, tilt_height, norm in tilt_params:
+				x, y, theta = place_along_face(cavity_polygon_verts, face_num, placement, mode=place_mode)
+				theta = theta + 90 * (1 - norm)
+
+				x = x - self.wall_thickness*np.sin(np.deg2rad(theta))
+				y = y + self.wall_thickness*np.cos(np.deg2rad(theta))
+
+				tilt_position = [x, y, -self.cavity_depth]
+				tilt_rotation = [0, 0, theta]
+
+				self.tilt_mounts.append(tilt_class(height=tilt_height, position=tilt_position, rotation=tilt_rotation))
+
+	def get_solid(self, mode='stl'):
+		outline = self.outline if self.outline is not None else polygon(array2tuples(self.outer_polygon_verts))
+		case = color([0,1,0])(
+					down(self.height)(linear_extrude(self.height, convexity=10)(
+						outline
+					)) - 
+					down(self.cavity_depth)(linear_extrude(self.cavity_depth, convexity=10)(
+						polygon(array2tuples(self.cavity_polygon_verts))
+					)) -
+					self.port.get_solid(mode=mode)
+				)
+
+		for tilt_mount in self.tilt_mounts:
+			case += tilt_mount.get_solid(mode=mode)
+
+		if mode=="stl":
+			case += self.port.get_io_solid(mode=mode)
+
+		return case
+
+	def get_layers(self, mode='stl'):
+		outer = LayeredSolid.extrude(ShapelyPolygon(self.outer_polygon_verts), -self.height, 0)
+		cavity = LayeredSolid.extrude(ShapelyPolygon(self.cavity_polygon_verts), -self.cavity_depth, 0)
+
+		case = outer - cavity - self.port.get_layers(mode=mode)
+		case = case.union(*[tilt_mount.get_layers(mode=mode) for tilt_mount in self.tilt_mounts])
+
+		if mode=="stl":
+			case += self.port.get_io_layers(mode=mode)
+
+		return case
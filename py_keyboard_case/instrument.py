@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+import functools
+import json
+import threading
+import time
+import tracemalloc
+
+
+class Profiler:
+	# wall time, call count and tracemalloc peak per named section. Times are inclusive of
+	# nested sections, peaks are the most memory allocated above the level at section entry
+	def __init__(self, trace_memory=True):
+		self.trace_memory = trace_memory
+		self.sections = {}
+		self.lock = threading.Lock()
+		self.local = threading.local()
+		self.start_time = None
+		self.seconds = None
+
+	def start(self):
+		self.start_time = time.perf_counter()
+		if self.trace_memory and not tracemalloc.is_tracing():
+			tracemalloc.start()
+		return self
+
+	def stop(self):
+		self.seconds = time.perf_counter() - self.start_time
+		if self.trace_memory and tracemalloc.is_tracing():
+			tracemalloc.stop()
+
+	def _stack(self):
+		if not hasattr(self.local, 'stack'):
+			self.local.stack = []
+		return self.local.stack
+
+	@contextmanager
+	def section(self, name):
+		stack = self._stack()
+		tracing = self.trace_memory and tracemalloc.is_tracing()
+		frame = {'start': 0, 'peak': 0}
+		if tracing:
+			current, peak = tracemalloc.get_traced_memory()
+			if stack:
+				# the peak is reset below, keep what the enclosing section has seen so far
+				stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+			tracemalloc.reset_peak()
+			frame['start'] = current
+
+		stack.append(frame)
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			seconds = time.perf_counter() - start
+			stack.pop()
+			peak_bytes = 0
+			if tracing:
+				peak = max(tracemalloc.get_traced_memory()[1], frame['peak'])
+				peak_bytes = peak - frame['start']
+				if stack:
+					stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+				tracemalloc.reset_peak()
+
+			with self.lock:
+				record = self.sections.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak_bytes': 0})
+				record['calls'] += 1
+				record['seconds'] += seconds
+				record['peak_bytes'] = max(record['peak_bytes'], peak_bytes)
+
+	def report(self):
+		sections = sorted(self.sections.items(), key=lambda item: item[1]['seconds'], reverse=True)
+		return {
+			'seconds': self.seconds,
+			'trace_memory': self.trace_memory,
+			'sections': {name: dict(record) for name, record in sections},
+		}
+
+	def write(self, filename):
+		with open(filename, 'w') as f:
+			json.dump(self.report(), f, indent=1)
+
+	def print_summary(self, limit=20):
+		print(f"{'seconds':>9s} {'calls':>7s} {'peak MB':>8s}  section")
+		for name, record in list(self.report()['sections'].items())[:limit]:
+			print(f"{record['seconds']:9.3f} {record['calls']:7d} {record['peak_bytes'] / 2**20:8.2f}  {name}")
+
+
+_profiler = None
+
+def active_profiler():
+	return _profiler
+
+@contextmanager
+def profiling(trace_memory=True):
+	# collect every section entered inside the block, e.g. around pipeline.generate
+	global _profiler
+	if _profiler is not None:
+		raise ValueError("a profiler is already active")
+	profiler = Profiler(trace_memory=trace_memory).start()
+	_profiler = profiler
+	try:
+		yield profiler
+	finally:
+		_profiler = None
+		profiler.stop()
+
+@contextmanager
+def section(name):
+	if _profiler is None:
+		yield
+		return
+	with _profiler.section(name):
+		yield
+
+def instrument(name=None):
+	# decorator form of section, named after the function by default
+	def decorator(fn):
+		section_name = name or fn.__qualname__
+
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			if _profiler is None:
+				return fn(*args, **kwargs)
+			with _profiler.section(section_name):
+				return fn(*args, **kwargs)
+		return wrapper
+	return decorator
@@ -0,0 +1,125 @@
+from collections import namedtuple
+
+import numpy as np
+import shapely
+from shapely import STRtree
+from shapely.geometry import Polygon as ShapelyPolygon
+from solid import rotate, translate
+
+from py_keyboard_case.layers import LayeredSolid, solid_to_layers
+from py_keyboard_case.screws import M2Standoff
+from py_keyboard_case.utils import key_plate_footprint, key_plate_footprint_dual_acrylic_solid, keycap_solid
+
+
+# 2D outline of a component plus the z range it occupies
+Footprint = namedtuple('Footprint', ['kind', 'name', 'geometry', 'z_min', 'z_max'])
+
+# distance between `point` and the other component is below the required clearance, 0 when they overlap
+Violation = namedtuple('Violation', ['kind_a', 'name_a', 'kind_b', 'name_b', 'distance', 'clearance', 'point'])
+
+# (kind, kind, minimum clearance in mm), pairs not listed here are allowed to touch
+CLEARANCE_RULES = [
+	('key', 'key', 0),
+	('keycap', 'keycap', 0),
+	('screw', 'key', 0.5),
+	('standoff', 'key', 0.5),
+	('screw', 'tilt', 0.5),
+	('standoff', 'tilt', 0.5),
+	('standoff', 'port', 0.5),
+	('io', 'wall', 0),
+	('io', 'standoff', 0.5),
+	('tilt', 'tilt', 0),
+	('tilt', 'port', 0),
+]
+
+# keycaps sit on the switches, this far above the plate
+KEYCAP_Z = (6.6, 14.6)
+
+# overlaps smaller than this (mm^2) are shared edges, not collisions
+AREA_TOLERANCE = 1e-6
+
+
+def _footprints(kind, name, layers):
+	# one per slab, so a floor below a component does not count as its neighbour
+	return [Footprint(kind, name, slab.geometry, slab.z_min, slab.z_max) for slab in layers]
+
+def component_footprints(housing, keys):
+	footprints = []
+	plate_height = housing.plate.height
+
+	for i, key in enumerate(keys):
+		name = f"key {i} ({key.x:g}, {key.y:g})"
+		cutout = solid_to_layers(key_plate_footprint(key, footprint_fn=key_plate_footprint_dual_acrylic_solid))
+		footprints += _footprints('key', name, cutout.translate([0, 0, plate_height]))
+		keycap = solid_to_layers(keycap_solid(key)).footprint()
+		footprints.append(Footprint('keycap', name, keycap, plate_height + KEYCAP_Z[0], plate_height + KEYCAP_Z[1]))
+
+	for i, screw in enumerate(housing.screws):
+		kind = 'standoff' if isinstance(screw, M2Standoff) else 'screw'
+		footprints += _footprints(kind, f"{type(screw).__name__} {i}", screw.get_layers())
+
+	case = housing.case
+	wall = LayeredSolid.extrude(ShapelyPolygon(case.outer_polygon_verts), -case.height, 0) - \
+		LayeredSolid.extrude(ShapelyPolygon(case.cavity_polygon_verts), -case.cavity_depth, 0)
+
+	port = housing.port
+	if port is not None:
+		port_layers = port.get_layers()
+		wall = wall - port_layers
+		footprints += _footprints('port', type(port).__name__, port_layers)
+		for i, io_mod in enumerate(port.io_mods):
+			# placed the way Port.get_io_solid places them
+			solid = translate([port.x, port.y, port.z])(rotate([0, 0, port.theta])(io_mod.get_solid()))
+			footprints += _footprints('io', f"{type(io_mod).__name__} {i}", solid_to_layers(solid))
+
+	footprints += _footprints('wall', "case wall", wall)
+
+	for i, tilt_mount in enumerate(case.tilt_mounts):
+		footprints += _footprints('tilt', f"{type(tilt_mount).__name__} {i}", tilt_mount.get_layers())
+
+	return [footprint for footprint in footprints if not footprint.geometry.is_empty]
+
+def find_interference(footprints, rules=CLEARANCE_RULES):
+	# every pair of footprints whose kinds have a rule, overlapping in z and closer than the rule's
+	# clearance. Candidates come from one STRtree query, so only nearby pairs are measured
+	clearances = {}
+	for kind_a, kind_b, clearance in rules:
+		clearances[(kind_a, kind_b)] = clearances[(kind_b, kind_a)] = clearance
+	if not footprints or not clearances:
+		return []
+
+	geometries = np.array([footprint.geometry for footprint in footprints])
+	tree = STRtree(geometries)
+	pairs = tree.query(geometries, predicate='dwithin', distance=max(clearances.values()))
+
+	# worst violation per pair of components, which may meet in several slabs
+	worst = {}
+	for i, j in zip(*pairs):
+		if i >= j:
+			continue
+		a, b = footprints[i], footprints[j]
+		clearance = clearances.get((a.kind, b.kind))
+		if clearance is None or (a.kind, a.name) == (b.kind, b.name) or a.z_min >= b.z_max or b.z_min >= a.z_max:
+			continue
+
+		violation = _violation(a, b, clearance)
+		key = (a.kind, a.name, b.kind, b.name)
+		if violation is not None and (key not in worst or violation.distance < worst[key].distance):
+			worst[key] = violation
+
+	return list(worst.values())
+
+def _violation(a, b, clearance):
+	overlap = a.geometry.intersection(b.geometry)
+	if overlap.area > AREA_TOLERANCE:
+		point = overlap.representative_point()
+		return Violation(a.kind, a.name, b.kind, b.name, 0.0, clearance, (point.x, point.y))
+
+	distance = a.geometry.distance(b.geometry)
+	if clearance > 0 and distance < clearance:
+		point = shapely.shortest_line(a.geometry, b.geometry).interpolate(0.5, normalized=True)
+		return Violation(a.kind, a.name, b.kind, b.name, distance, clearance, (point.x, point.y))
+	return None
+
+def check_interference(housing, keys, rules=CLEARANCE_RULES):
+	return find_interference(component_footprints(housing, keys), rules=rules)
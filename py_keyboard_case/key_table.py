@@ -0,0 +1,62 @@
+from collections import namedtuple
+import numpy as np
+
+
+KEY_FIELDS = ('x', 'y', 'width', 'height', 'rotation_angle', 'rotation_x', 'rotation_y')
+
+# lightweight stand in for a pykle Key, anything taking a key only reads these fields
+KeyRow = namedtuple('KeyRow', KEY_FIELDS)
+
+
+class KeyTable:
+	fields = KEY_FIELDS
+
+	def __init__(self, x, y, width, height, rotation_angle, rotation_x, rotation_y):
+		self.x = np.ascontiguousarray(x, dtype=float)
+		self.y = np.ascontiguousarray(y, dtype=float)
+		self.width = np.ascontiguousarray(width, dtype=float)
+		self.height = np.ascontiguousarray(height, dtype=float)
+		self.rotation_angle = np.ascontiguousarray(rotation_angle, dtype=float)
+		self.rotation_x = np.ascontiguousarray(rotation_x, dtype=float)
+		self.rotation_y = np.ascontiguousarray(rotation_y, dtype=float)
+
+		lengths = {len(getattr(self, field)) for field in self.fields}
+		assert len(lengths) <= 1, "all key fields must have the same length"
+
+	@classmethod
+	def from_keys(cls, keys):
+		return cls(*[[getattr(key, field) for key in keys] for field in cls.fields])
+
+	@classmethod
+	def from_kle(cls, layout):
+		import pykle_serial as kle_serial
+
+		keyboard = kle_serial.parse(layout)
+		return cls.from_keys(keyboard.keys)
+
+	@classmethod
+	def load(cls, file):
+		with np.load(file) as data:
+			return cls(*[data[field] for field in cls.fields])
+
+	def save(self, file):
+		np.savez(file, **{field: getattr(self, field) for field in self.fields})
+
+	def arrays(self):
+		return tuple(getattr(self, field) for field in self.fields)
+
+	def __len__(self):
+		return len(self.x)
+
+	def __getitem__(self, idx):
+		if isinstance(idx, (int, np.integer)):
+			return KeyRow(*[float(array[idx]) for array in self.arrays()])
+
+		return KeyTable(*[array[idx] for array in self.arrays()])
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	def __repr__(self):
+		return f"KeyTable({len(self)} keys)"
@@ -0,0 +1,396 @@
+from bisect import bisect_right
+from collections import namedtuple
+import math
+
+import numpy as np
+from shapely import affinity
+from shapely.geometry import Polygon as ShapelyPolygon
+from shapely.geometry import box
+from shapely.geometry.base import BaseGeometry
+from shapely.ops import unary_union
+
+from py_keyboard_case.instrument import instrument
+
+
+# z values closer than this are treated as the same slab boundary
+Z_DECIMALS = 6
+# number of constant radius steps used to approximate a cone
+CONE_STEPS = 8
+
+Slab = namedtuple('Slab', ['z_min', 'z_max', 'geometry'])
+
+
+def _empty():
+	return ShapelyPolygon()
+
+def _round_z(z):
+	return round(float(z), Z_DECIMALS)
+
+
+class LayeredSolid:
+	# 2.5D solid: ordered, non overlapping (z_min, z_max, shapely geometry) slabs
+	def __init__(self, slabs=None):
+		slabs = [Slab(_round_z(z_min), _round_z(z_max), geometry) for z_min, z_max, geometry in (slabs or [])]
+		slabs = [slab for slab in slabs if slab.z_max > slab.z_min and not slab.geometry.is_empty]
+		slabs.sort(key=lambda slab: slab.z_min)
+
+		for below, above in zip(slabs, slabs[1:]):
+			assert below.z_max <= above.z_min, "slabs must not overlap"
+
+		self.slabs = self._merge_equal(slabs)
+		self._z_mins = [slab.z_min for slab in self.slabs]
+
+	@classmethod
+	def extrude(cls, geometry, z_min, z_max):
+		return cls([Slab(z_min, z_max, geometry)])
+
+	@staticmethod
+	def _merge_equal(slabs):
+		merged = []
+		for slab in slabs:
+			if merged:
+				last = merged[-1]
+				if last.z_max == slab.z_min and (last.geometry is slab.geometry or last.geometry.equals(slab.geometry)):
+					merged[-1] = Slab(last.z_min, slab.z_max, last.geometry)
+					continue
+			merged.append(slab)
+		return merged
+
+	@property
+	def is_empty(self):
+		return len(self.slabs) == 0
+
+	@property
+	def z_min(self):
+		return self.slabs[0].z_min if self.slabs else 0
+
+	@property
+	def z_max(self):
+		return self.slabs[-1].z_max if self.slabs else 0
+
+	@property
+	def height(self):
+		return self.z_max - self.z_min
+
+	def __len__(self):
+		return len(self.slabs)
+
+	def __iter__(self):
+		return iter(self.slabs)
+
+	def __repr__(self):
+		return f"LayeredSolid({len(self.slabs)} slabs, z=[{self.z_min}, {self.z_max}])"
+
+	def outline_at(self, z):
+		# cross section at height z, slabs are closed at the bottom and open at the top
+		idx = bisect_right(self._z_mins, z) - 1
+		if idx >= 0 and z < self.slabs[idx].z_max:
+			return self.slabs[idx].geometry
+		return _empty()
+
+	def footprint(self):
+		return unary_union([slab.geometry for slab in self.slabs])
+
+	def section(self, z_min, z_max):
+		return self.intersection(LayeredSolid.extrude(box(*self._bounds_2d()), z_min, z_max))
+
+	def _bounds_2d(self):
+		return self.footprint().bounds if self.slabs else (0, 0, 0, 0)
+
+	@staticmethod
+	def combine(solids, op):
+		# apply op(list of geometries covering each z interval) over the union of all breakpoints
+		solids = [solid for solid in solids if solid is not None]
+		breaks = sorted({z for solid in solids for slab in solid.slabs for z in (slab.z_min, slab.z_max)})
+
+		slabs = []
+		for z_min, z_max in zip(breaks, breaks[1:]):
+			z_mid = 0.5 * (z_min + z_max)
+			geometry = op([solid.outline_at(z_mid) for solid in solids])
+			if geometry is not None and not geometry.is_empty:
+				slabs.append(Slab(z_min, z_max, geometry))
+
+		return LayeredSolid(slabs)
+
+	@staticmethod
+	def union_all(solids):
+		return LayeredSolid.combine(solids, lambda geometries: unary_union([g for g in geometries if not g.is_empty]))
+
+	def union(self, *others):
+		return LayeredSolid.union_all([self, *others])
+
+	def difference(self, *others):
+		if not others:
+			return self
+		cut = LayeredSolid.union_all(others)
+		return LayeredSolid.combine([self, cut], lambda geometries: geometries[0].difference(geometries[1]))
+
+	def intersection(self, *others):
+		def _intersect(geometries):
+			result = geometries[0]
+			for geometry in geometries[1:]:
+				result = result.intersection(geometry)
+			return result
+
+		return LayeredSolid.combine([self, *others], _intersect)
+
+	def __add__(self, other):
+		return self.union(other)
+
+	def __sub__(self, other):
+		return self.difference(other)
+
+	def __mul__(self, other):
+		return self.intersection(other)
+
+	def map_geometry(self, fn):
+		return LayeredSolid([Slab(slab.z_min, slab.z_max, fn(slab.geometry)) for slab in self.slabs])
+
+	def translate(self, v):
+		x, y, z = (list(v) + [0, 0, 0])[:3]
+		return LayeredSolid([
+			Slab(slab.z_min + z, slab.z_max + z, affinity.translate(slab.geometry, x, y))
+			for slab in self.slabs])
+
+	def flip_z(self):
+		return LayeredSolid([Slab(-slab.z_max, -slab.z_min, slab.geometry) for slab in self.slabs])
+
+	def rotate(self, a):
+		# only rotations that keep slabs horizontal: x and y angles must be multiples of 180
+		rx, ry, rz = _rotation_vector(a)
+
+		solid = self
+		if _is_half_turn(rx):
+			solid = solid.flip_z().map_geometry(lambda g: affinity.scale(g, 1, -1, origin=(0, 0)))
+		elif not _is_full_turn(rx):
+			raise ValueError(f"cannot rotate layers by {rx} degrees about x")
+
+		if _is_half_turn(ry):
+			solid = solid.flip_z().map_geometry(lambda g: affinity.scale(g, -1, 1, origin=(0, 0)))
+		elif not _is_full_turn(ry):
+			raise ValueError(f"cannot rotate layers by {ry} degrees about y")
+
+		if not _is_full_turn(rz):
+			solid = solid.map_geometry(lambda g: affinity.rotate(g, rz, origin=(0, 0)))
+
+		return solid
+
+
+def _rotation_vector(a):
+	if a is None:
+		return 0, 0, 0
+	if np.isscalar(a):
+		return 0, 0, float(a)
+	return tuple(float(angle) for angle in a)
+
+def _is_full_turn(angle):
+	return math.isclose(math.remainder(angle, 360), 0, abs_tol=1e-9)
+
+def _is_half_turn(angle):
+	return math.isclose(abs(math.remainder(angle, 360)), 180, abs_tol=1e-9)
+
+def circle_fragments(r, segments=None):
+	# OpenSCAD's get_fragments_from_r with the default $fa=12, $fs=2
+	if segments:
+		return max(int(segments), 3)
+	return int(math.ceil(max(min(360 / 12, r * 2 * math.pi / 2), 5)))
+
+def regular_polygon(r, segments):
+	theta = 2 * np.pi * np.arange(segments) / segments
+	return ShapelyPolygon(np.stack((r * np.cos(theta), r * np.sin(theta)), axis=1))
+
+
+@instrument()
+def solid_to_layers(solid):
+	# evaluate a SolidPython tree of extrusions into a LayeredSolid without OpenSCAD
+	shape, holes = _evaluate(solid)
+	shape = _as_layers(shape)
+	if holes is not None:
+		shape = shape.difference(holes)
+	return shape
+
+def _as_layers(shape):
+	if shape is None:
+		return LayeredSolid()
+	if isinstance(shape, BaseGeometry):
+		raise ValueError("expected a 3D solid, got a 2D shape")
+	return shape
+
+def _params(node):
+	params = dict(node.params)
+	if '$fn' in params:
+		params['segments'] = params.pop('$fn')
+	return params
+
+def _union_shapes(shapes):
+	shapes = [shape for shape in shapes if shape is not None]
+	if not shapes:
+		return None
+	if all(isinstance(shape, BaseGeometry) for shape in shapes):
+		return unary_union(shapes)
+	return LayeredSolid.union_all([_as_layers(shape) for shape in shapes])
+
+def _union_holes(holes):
+	holes = [hole for hole in holes if hole is not None]
+	if not holes:
+		return None
+	return LayeredSolid.union_all(holes)
+
+def _transform(shape, node):
+	if shape is None:
+		return None
+
+	params = _params(node)
+	if node.name == 'translate':
+		v = params.get('v') or [0, 0, 0]
+		if isinstance(shape, BaseGeometry):
+			return affinity.translate(shape, v[0], v[1])
+		return shape.translate(v)
+	if node.name == 'rotate':
+		if params.get('v') is not None:
+			raise ValueError("rotate about an arbitrary axis is not supported in layers")
+		if isinstance(shape, BaseGeometry):
+			_, _, rz = _rotation_vector(params.get('a'))
+			return affinity.rotate(shape, rz, origin=(0, 0))
+		return shape.rotate(params.get('a'))
+	if node.name == 'mirror':
+		v = (list(params.get('v')) + [0, 0, 0])[:3]
+		if v[2] and (v[0] or v[1]):
+			raise ValueError("mirror about a tilted plane is not supported in layers")
+		if isinstance(shape, BaseGeometry):
+			return _mirror_2d(shape, v)
+		if v[2]:
+			return shape.flip_z()
+		return shape.map_geometry(lambda g: _mirror_2d(g, v))
+	# color and other purely visual wrappers
+	return shape
+
+def _mirror_2d(geometry, v):
+	angle = math.degrees(math.atan2(v[1], v[0]))
+	geometry = affinity.rotate(geometry, -angle, origin=(0, 0))
+	geometry = affinity.scale(geometry, -1, 1, origin=(0, 0))
+	return affinity.rotate(geometry, angle, origin=(0, 0))
+
+def _primitive(node):
+	params = _params(node)
+
+	if node.name == 'cube':
+		size = params.get('size')
+		size = [size]*3 if np.isscalar(size) else list(size)
+		if params.get('center'):
+			return LayeredSolid.extrude(box(-size[0]/2, -size[1]/2, size[0]/2, size[1]/2), -size[2]/2, size[2]/2)
+		return LayeredSolid.extrude(box(0, 0, size[0], size[1]), 0, size[2])
+
+	if node.name == 'cylinder':
+		h = params.get('h') or 1
+		r = params.get('r')
+		if params.get('d') is not None:
+			r = params['d'] / 2
+		r1 = params.get('r1') if params.get('r1') is not None else r
+		r2 = params.get('r2') if params.get('r2') is not None else r
+		if params.get('d1') is not None:
+			r1 = params['d1'] / 2
+		if params.get('d2') is not None:
+			r2 = params['d2'] / 2
+		r1 = 1 if r1 is None else r1
+		r2 = 1 if r2 is None else r2
+
+		z_min = -h/2 if params.get('center') else 0
+		segments = circle_fragments(max(r1, r2), params.get('segments'))
+
+		if math.isclose(r1, r2):
+			return LayeredSolid.extrude(regular_polygon(r1, segments), z_min, z_min + h)
+
+		steps = np.linspace(0, 1, CONE_STEPS + 1)
+		return LayeredSolid([
+			Slab(z_min + h*t0, z_min + h*t1, regular_polygon(r1 + (r2 - r1)*0.5*(t0 + t1), segments))
+			for t0, t1 in zip(steps, steps[1:])])
+
+	if node.name == 'square':
+		size = params.get('size') or 1
+		size = [size]*2 if np.isscalar(size) else list(size)
+		if params.get('center'):
+			return box(-size[0]/2, -size[1]/2, size[0]/2, size[1]/2)
+		return box(0, 0, size[0], size[1])
+
+	if node.name == 'circle':
+		r = params['d']/2 if params.get('d') is not None else (params.get('r') or 1)
+		return regular_polygon(r, circle_fragments(r, params.get('segments')))
+
+	if node.name == 'polygon':
+		points = [tuple(point[:2]) for point in params['points']]
+		paths = params.get('paths')
+		if not paths:
+			return ShapelyPolygon(points).buffer(0)
+		# even-odd fill, like OpenSCAD
+		geometry = _empty()
+		for path in paths:
+			geometry = geometry.symmetric_difference(ShapelyPolygon([points[i] for i in path]).buffer(0))
+		return geometry
+
+	raise ValueError(f"cannot convert '{node.name}' to layers")
+
+def _evaluate(node):
+	# returns (shape, holes): shape is a LayeredSolid, a 2D shapely geometry or None.
+	# holes follow SolidPython's hole()/part() semantics and are subtracted at the part root
+	if not node.children:
+		if node.name in ('union', 'difference', 'intersection', 'part', 'hole'):
+			return None, None
+		if node.is_hole:
+			return None, _as_layers(_primitive(node))
+		return _primitive(node), None
+
+	results = [_evaluate(child) for child in node.children]
+	shapes = [shape for shape, _ in results]
+	holes = _union_holes([hole for _, hole in results])
+
+	if node.name in ('union', 'part', 'hole', 'translate', 'rotate', 'mirror', 'color'):
+		shape = _union_shapes(shapes)
+	elif node.name == 'difference':
+		first = shapes[0]
+		rest = _union_shapes(shapes[1:])
+		if first is None or rest is None:
+			shape = first
+		elif isinstance(first, BaseGeometry):
+			shape = first.difference(rest)
+		else:
+			shape = first.difference(_as_layers(rest))
+	elif node.name == 'intersection':
+		if any(shape is None for shape in shapes):
+			shape = None
+		elif all(isinstance(shape, BaseGeometry) for shape in shapes):
+			shape = shapes[0]
+			for other in shapes[1:]:
+				shape = shape.intersection(other)
+		else:
+			shape = shapes[0].intersection(*shapes[1:])
+	elif node.name == 'linear_extrude':
+		params = _params(node)
+		if params.get('twist') or params.get('scale') not in (None, 1):
+			raise ValueError("twisted or scaled extrusions are not supported in layers")
+		height = params.get('height') or 1
+		z_min = -height/2 if params.get('center') else 0
+		geometry = _union_shapes(shapes)
+		shape = None if geometry is None else LayeredSolid.extrude(geometry, z_min, z_min + height)
+	elif node.name == 'offset':
+		params = _params(node)
+		geometry = _union_shapes(shapes)
+		if params.get('r') is not None:
+			shape = geometry.buffer(params['r'], quad_segs=max(circle_fragments(abs(params['r']), params.get('segments')) // 4, 1))
+		else:
+			shape = geometry.buffer(params['delta'], join_style='bevel' if params.get('chamfer') else 'mitre')
+	else:
+		raise ValueError(f"cannot convert '{node.name}' to layers")
+
+	shape = _transform(shape, node)
+	holes = _transform(holes, node)
+
+	if node.is_hole:
+		return None, _union_holes([_as_layers(shape), holes])
+
+	if node.is_part_root:
+		if holes is not None:
+			shape = _as_layers(shape).difference(holes)
+		holes = None
+
+	return shape, holes
@@ -0,0 +1,228 @@
+import numpy as np
+import shapely
+from shapely.geometry.polygon import orient
+
+from py_keyboard_case.cache import write_if_changed
+from py_keyboard_case.export import geometry_polygons
+from py_keyboard_case.instrument import instrument
+
+
+def empty_mesh():
+	return np.empty((0, 3, 3))
+
+def triangulate(geometry):
+	# (M,3,2) counter clockwise triangles covering a polygon with holes
+	triangles = [shapely.get_coordinates(shapely.get_parts(shapely.constrained_delaunay_triangles(polygon))).reshape(-1, 4, 2)[:, :3]
+		for polygon in geometry_polygons(geometry)]
+	if not triangles:
+		return np.empty((0, 3, 2))
+	triangles = np.concatenate(triangles)
+	(x0, y0), (x1, y1), (x2, y2) = np.moveaxis(triangles, (1, 2), (0, 1))
+	clockwise = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0) < 0
+	triangles[clockwise] = triangles[clockwise, ::-1]
+	return triangles
+
+# points further than this (mm) from a segment are not on it. Intersections found when noding
+# are within floating point error of both segments, vertices that only come close are not
+ON_SEGMENT = 1e-9
+
+# outlines are snapped to this grid (mm) before meshing, so no two vertices are closer than an
+# STL's float32 coordinates can tell apart
+GRID = 1e-4
+
+def _cap(geometry, z, up=True):
+	triangles = triangulate(geometry)
+	if not up:
+		triangles = triangles[:, ::-1, :]
+	return np.concatenate((triangles, np.full(triangles.shape[:2] + (1,), z)), axis=2)
+
+def _rings(geometry):
+	# ring coords, with the closing vertex, of every polygon oriented counter clockwise
+	for polygon in geometry_polygons(geometry):
+		polygon = orient(polygon, 1.0)
+		for ring in [polygon.exterior, *polygon.interiors]:
+			yield np.asarray(ring.coords)[:, :2]
+
+def _level(below, above):
+	# where the slab `below` ends and `above` starts (either may be None): the vertices of both
+	# outlines noded against each other, and the faces of that arrangement that need an up or
+	# down facing cap. Walls and caps both take their vertices from here, so they meet edge to edge
+	geometries = [geometry for geometry in (below, above) if geometry is not None]
+	lines = shapely.node(shapely.MultiLineString([coords for geometry in geometries for coords in _rings(geometry)]))
+	points = np.unique(shapely.get_coordinates(lines), axis=0)
+	tree = shapely.STRtree(shapely.points(points))
+
+	# noding misses vertices that only touch a segment to within rounding, split there as the walls do
+	parts = shapely.get_parts(lines)
+	coords, index = shapely.get_coordinates(parts, return_index=True)
+	chains = np.split(coords, np.flatnonzero(np.diff(index)) + 1)
+	_, _, splits = _split_points(chains, points, tree)
+	ends = np.cumsum([len(coords) - 1 for coords in chains])
+	split_chains = set(np.searchsorted(ends, list(splits), side='right').tolist())
+
+	edges = []
+	for k, coords in enumerate(chains):
+		if k not in split_chains:
+			edges.append(parts[k])
+			continue
+		first = ends[k] - (len(coords) - 1)
+		edge = [coords[0]]
+		for i in range(len(coords) - 1):
+			for _, j in splits.get(first + i, []):
+				edges.append(shapely.LineString(edge + [points[j]]))
+				edge = [points[j]]
+			edge.append(coords[i + 1])
+		edges.append(shapely.LineString(edge))
+
+	up, down = [], []
+	for face in shapely.polygonize(edges).geoms:
+		point = face.representative_point()
+		in_below = below is not None and below.contains(point)
+		in_above = above is not None and above.contains(point)
+		if in_below and not in_above:
+			up.append(face)
+		elif in_above and not in_below:
+			down.append(face)
+	return (points, tree), shapely.MultiPolygon(up), shapely.MultiPolygon(down)
+
+def _split_points(chains, points, tree):
+	# the segments (a, b) of every chain of coords, one after the other, and for the segments that
+	# level points (in `tree`) lie on, their distances along the segment and indices, in order
+	a = np.concatenate([coords[:-1] for coords in chains])
+	b = np.concatenate([coords[1:] for coords in chains])
+	# bounding boxes only, the distance to the segment is checked below
+	lower, upper = np.minimum(a, b) - ON_SEGMENT, np.maximum(a, b) + ON_SEGMENT
+	segment_idx, point_idx = tree.query(shapely.box(lower[:, 0], lower[:, 1], upper[:, 0], upper[:, 1]))
+
+	# most hits are the segment's own ends
+	direction = b[segment_idx] - a[segment_idx]
+	length = np.hypot(direction[:, 0], direction[:, 1])
+	offset = points[point_idx] - a[segment_idx]
+	along = np.einsum('ij,ij->i', offset, direction) / length
+	across = np.abs(offset[:, 0] * direction[:, 1] - offset[:, 1] * direction[:, 0]) / length
+	inside = (along > ON_SEGMENT) & (along < length - ON_SEGMENT) & (across <= ON_SEGMENT)
+
+	splits = {}
+	for i, distance, j in zip(segment_idx[inside].tolist(), along[inside].tolist(), point_idx[inside].tolist()):
+		splits.setdefault(i, []).append((distance, j))
+	for split in splits.values():
+		split.sort()
+	return a, b, splits
+
+def _walls(geometry, z_min, z_max, bottom_level, top_level):
+	# one strip per ring segment, its bottom edge split where the bottom level has points on it
+	# and its top edge where the top level has. Levels are (points, tree) from _level
+	(bottom_points, bottom_tree), (top_points, top_tree) = bottom_level, top_level
+	rings = list(_rings(geometry))
+	if not rings:
+		return empty_mesh()
+	a, b, bottom_splits = _split_points(rings, bottom_points, bottom_tree)
+	_, _, top_splits = _split_points(rings, top_points, top_tree)
+
+	# a segment split on neither edge is a plain quad
+	plain = np.ones(len(a), dtype=bool)
+	plain[list(bottom_splits) + list(top_splits)] = False
+	a_min, b_min = np.insert(a[plain], 2, z_min, axis=1), np.insert(b[plain], 2, z_min, axis=1)
+	a_max, b_max = np.insert(a[plain], 2, z_max, axis=1), np.insert(b[plain], 2, z_max, axis=1)
+	walls = [np.stack((a_min, b_min, a_max), axis=1), np.stack((b_min, b_max, a_max), axis=1)]
+
+	strips = []
+	for i in np.flatnonzero(~plain):
+		bottom = [(0, a[i])] + [(along, bottom_points[j]) for along, j in bottom_splits.get(i, [])] + [(np.inf, b[i])]
+		top = [(0, a[i])] + [(along, top_points[j]) for along, j in top_splits.get(i, [])] + [(np.inf, b[i])]
+
+		# zip the two edges together, always advancing the one whose next point comes first
+		k = m = 0
+		while k < len(bottom) - 1 or m < len(top) - 1:
+			if m == len(top) - 1 or (k < len(bottom) - 1 and bottom[k + 1][0] <= top[m + 1][0]):
+				strips.append(((*bottom[k][1], z_min), (*bottom[k + 1][1], z_min), (*top[m][1], z_max)))
+				k += 1
+			else:
+				strips.append(((*bottom[k][1], z_min), (*top[m + 1][1], z_max), (*top[m][1], z_max)))
+				m += 1
+	if strips:
+		walls.append(np.array(strips, dtype=float))
+	return np.concatenate(walls)
+
+@instrument()
+def layers_to_mesh(layers):
+	# side walls for every slab, caps wherever the cross section changes between slabs.
+	# Each level's outlines are noded together once and walls and caps are split at those
+	# nodes, so there are no T-junctions and every edge belongs to exactly two triangles
+	slabs = [(slab.z_min, slab.z_max, shapely.set_precision(slab.geometry, GRID)) for slab in layers]
+	levels = {}
+	for z_min, z_max, geometry in slabs:
+		levels.setdefault(z_min, [None, None])[1] = geometry
+		levels.setdefault(z_max, [None, None])[0] = geometry
+
+	parts = [empty_mesh()]
+	points = {}
+	for z, (below, above) in levels.items():
+		points[z], up, down = _level(below, above)
+		parts.append(_cap(up, z, up=True))
+		parts.append(_cap(down, z, up=False))
+
+	for z_min, z_max, geometry in slabs:
+		parts.append(_walls(geometry, z_min, z_max, points[z_min], points[z_max]))
+
+	return np.concatenate(parts)
+
+def lathe_mesh(profile, segments):
+	# solid of revolution about z from a bottom to top list of (z, r) points
+	profile = [point for i, point in enumerate(profile) if i == 0 or point != profile[i - 1]]
+	theta = 2 * np.pi * np.arange(segments + 1) / segments
+	cos, sin = np.cos(theta), np.sin(theta)
+
+	def ring(z, r):
+		return np.column_stack((r * cos, r * sin, np.full(len(theta), z)))
+
+	parts = [empty_mesh()]
+	for (z0, r0), (z1, r1) in zip(profile, profile[1:]):
+		lower, upper = ring(z0, r0), ring(z1, r1)
+		parts.append(np.stack((lower[:-1], lower[1:], upper[1:]), axis=1))
+		parts.append(np.stack((lower[:-1], upper[1:], upper[:-1]), axis=1))
+
+	for (z, r), up in ((profile[0], False), (profile[-1], True)):
+		if r <= 0:
+			continue
+		rim = ring(z, r)
+		center = np.array([0, 0, z])
+		fan = np.stack((np.broadcast_to(center, rim[:-1].shape), rim[:-1], rim[1:]), axis=1)
+		parts.append(fan if up else fan[:, ::-1, :])
+
+	return np.concatenate(parts)
+
+def rotation_matrix(rotation):
+	# OpenSCAD rotate([x, y, z]): about x, then y, then z
+	rx, ry, rz = np.deg2rad(rotation)
+	Rx = np.array([[1, 0, 0], [0, np.cos(rx), -np.sin(rx)], [0, np.sin(rx), np.cos(rx)]])
+	Ry = np.array([[np.cos(ry), 0, np.sin(ry)], [0, 1, 0], [-np.sin(ry), 0, np.cos(ry)]])
+	Rz = np.array([[np.cos(rz), -np.sin(rz), 0], [np.sin(rz), np.cos(rz), 0], [0, 0, 1]])
+	return Rz @ Ry @ Rx
+
+def transform_mesh(mesh, position=None, rotation=None):
+	if rotation is not None:
+		mesh = mesh @ rotation_matrix(rotation).T
+	if position is not None:
+		mesh = mesh + np.asarray(position, dtype=float)
+	return mesh
+
+STL_DTYPE = np.dtype([
+	('normal', '<f4', (3,)),
+	('vertices', '<f4', (3, 3)),
+	('attr', '<u2'),
+])
+
+@instrument()
+def write_stl(filename, mesh, header=b'py_keyboard_case'):
+	mesh = np.asarray(mesh, dtype=float).reshape(-1, 3, 3)
+
+	normals = np.cross(mesh[:, 1] - mesh[:, 0], mesh[:, 2] - mesh[:, 0])
+	lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+	normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+	data = np.zeros(len(mesh), dtype=STL_DTYPE)
+	data['normal'] = normals
+	data['vertices'] = mesh
+
+	write_if_changed(filename, header[:80].ljust(80, b'\0') + np.uint32(len(mesh)).tobytes() + data.tobytes())
@@ -0,0 +1,235 @@
+from collections import namedtuple
+import json
+import os
+
+import shapely
+from shapely import affinity
+from shapely.geometry import Polygon as ShapelyPolygon
+from shapely.ops import unary_union
+
+from py_keyboard_case.cache import write_if_changed
+from py_keyboard_case.export import geometry_polygons, remove_numbered, write_cut
+from py_keyboard_case.instrument import instrument
+
+
+# placed = translate(rotate(part geometry, angle degrees about the origin), offset), in sheet coordinates
+Placement = namedtuple('Placement', ['label', 'angle', 'offset', 'geometry'])
+
+# parts cut from one sheet of stock
+Sheet = namedtuple('Sheet', ['thickness', 'placements'])
+
+EPS = 1e-9
+
+
+def _shell(geometry):
+	# the area a part takes up, holes included
+	return unary_union([ShapelyPolygon(polygon.exterior) for polygon in geometry_polygons(geometry)])
+
+
+class _SheetLayout:
+	# skyline bottom left packing of bounding boxes over the usable area of one sheet,
+	# optionally followed by sliding each part down and left against the outlines already placed
+	def __init__(self, width, height, spacing):
+		self.width = width
+		self.height = height
+		self.spacing = spacing
+		# [x, y, width] segments covering [0, width], y is the top of everything placed below
+		self.skyline = [[0, 0, width]]
+		self.placed = []
+		self.occupied = None
+
+	def fit(self, width, height):
+		# lowest, then leftmost, position for a width x height box, None when it does not fit
+		best = None
+		for i, (x, _, _) in enumerate(self.skyline):
+			if x + width > self.width + EPS:
+				break
+			y = 0
+			for seg_x, seg_y, seg_width in self.skyline[i:]:
+				if seg_x >= x + width - EPS:
+					break
+				y = max(y, seg_y)
+			if y + height <= self.height + EPS and (best is None or (y, x) < (best[1], best[0])):
+				best = (x, y)
+		return best
+
+	def add(self, x, y, width, height, shell):
+		# raise the skyline over [x, x + width] to at least the box top
+		top = y + height
+		skyline = []
+		for seg_x, seg_y, seg_width in self.skyline:
+			seg_end = seg_x + seg_width
+			for start, end, raised in ((seg_x, min(seg_end, x), False), (max(seg_x, x), min(seg_end, x + width), True), (max(seg_x, x + width), seg_end, False)):
+				if end - start > EPS:
+					seg_top = max(seg_y, top) if raised else seg_y
+					if skyline and abs(skyline[-1][1] - seg_top) < EPS:
+						skyline[-1][2] += end - start
+					else:
+						skyline.append([start, seg_top, end - start])
+		self.skyline = skyline
+
+		self.placed.append(shell)
+		self.occupied = unary_union(self.placed)
+		shapely.prepare(self.occupied)
+
+	def collides(self, shell):
+		return self.occupied is not None and shapely.dwithin(self.occupied, shell, self.spacing - EPS)
+
+	def slide(self, shell, x, y, step, max_rounds=8):
+		# move `shell` (at the origin) from (x, y) down, then left, and again, for as long as it
+		# stays clear of the parts already placed. Returns the new (x, y)
+		def clear(x, y):
+			return not self.collides(affinity.translate(shell, x, y))
+
+		for _ in range(max_rounds):
+			down = _slide_distance(lambda d: clear(x, y - d), y, step)
+			y -= down
+			left = _slide_distance(lambda d: clear(x - d, y), x, step)
+			x -= left
+			if down < EPS and left < EPS:
+				break
+		return x, y
+
+def _slide_distance(clear, limit, step):
+	# furthest distance up to `limit` reached in `step` sized moves that stay clear,
+	# with the last blocked step bisected
+	distance = 0
+	while distance < limit - EPS:
+		next_distance = min(distance + step, limit)
+		if clear(next_distance):
+			distance = next_distance
+			continue
+		lo, hi = distance, next_distance
+		for _ in range(12):
+			mid = (lo + hi) / 2
+			if clear(mid):
+				lo = mid
+			else:
+				hi = mid
+		return lo
+	return distance
+
+def _orientations(geometry, rotations):
+	# (angle, rotated geometry moved to start at the origin, its shell, the move)
+	orientations = []
+	for angle in rotations:
+		rotated = affinity.rotate(geometry, angle, origin=(0, 0))
+		min_x, min_y, _, _ = rotated.bounds
+		rotated = affinity.translate(rotated, -min_x, -min_y)
+		orientations.append((angle, rotated, _shell(rotated), (-min_x, -min_y)))
+	return orientations
+
+@instrument()
+def nest(parts, sheet_size, spacing=2, margin=5, rotations=(0, 90, 180, 270), refine=False, refine_step=1):
+	# packs (label, geometry) parts onto as few sheet_size (width, height) sheets as it can,
+	# first fit in order of decreasing bounding box area. Returns one list of Placements per sheet.
+	# spacing is kept between parts (by bounding box, or by outline with refine) and margin from
+	# the sheet edges
+	width, height = sheet_size
+	usable = (width - 2 * margin + spacing, height - 2 * margin + spacing)
+	if usable[0] <= 0 or usable[1] <= 0:
+		raise ValueError(f"sheet {width}x{height} has no room inside a {margin}mm margin")
+
+	def area(part):
+		min_x, min_y, max_x, max_y = part[1].bounds
+		return (max_x - min_x) * (max_y - min_y)
+
+	layouts = []
+	sheets = []
+	for label, geometry in sorted(parts, key=area, reverse=True):
+		if geometry.is_empty:
+			continue
+		orientations = _orientations(geometry, rotations)
+
+		for layout, placements in zip(layouts, sheets):
+			if _place(layout, placements, label, orientations, spacing, margin, refine, refine_step):
+				break
+		else:
+			layout = _SheetLayout(*usable, spacing)
+			placements = []
+			if not _place(layout, placements, label, orientations, spacing, margin, refine, refine_step):
+				min_x, min_y, max_x, max_y = geometry.bounds
+				raise ValueError(f"{label} ({max_x - min_x:.1f}x{max_y - min_y:.1f}mm) does not fit on a {width}x{height} sheet")
+			layouts.append(layout)
+			sheets.append(placements)
+
+	return sheets
+
+def fits_sheet(geometry, sheet_size, spacing=2, margin=5, rotations=(0, 90, 180, 270)):
+	# whether nest can place the part on an empty sheet in one of the rotations. An empty part
+	# always fits, nest skips it
+	if geometry.is_empty:
+		return True
+	width, height = sheet_size
+	usable = (width - 2 * margin + spacing, height - 2 * margin + spacing)
+	for _, rotated, _, _ in _orientations(geometry, rotations):
+		_, _, part_width, part_height = rotated.bounds
+		if part_width + spacing <= usable[0] + EPS and part_height + spacing <= usable[1] + EPS:
+			return True
+	return False
+
+def _place(layout, placements, label, orientations, spacing, margin, refine, refine_step):
+	# best orientation of a part on this sheet, added to `placements`. False when none fits
+	best = None
+	for angle, rotated, shell, shift in orientations:
+		_, _, part_width, part_height = rotated.bounds
+		position = layout.fit(part_width + spacing, part_height + spacing)
+		if position is None:
+			continue
+		if refine:
+			position = layout.slide(shell, *position, refine_step)
+		x, y = position
+		# lowest top first, then leftmost
+		score = (y + part_height, x)
+		if best is None or score < best[0]:
+			best = (score, angle, rotated, shell, shift, x, y)
+
+	if best is None:
+		return False
+
+	_, angle, rotated, shell, shift, x, y = best
+	_, _, part_width, part_height = rotated.bounds
+	layout.add(x, y, part_width + spacing, part_height + spacing, affinity.translate(shell, x, y))
+
+	offset = (shift[0] + x + margin, shift[1] + y + margin)
+	placements.append(Placement(label, angle, offset, affinity.translate(rotated, x + margin, y + margin)))
+	return True
+
+def nest_layers(parts, sheet_size, **kwargs):
+	# (label, thickness, geometry) parts, only those of the same thickness share a sheet.
+	# kwargs are passed to nest
+	thicknesses = []
+	for _, thickness, _ in parts:
+		if thickness not in thicknesses:
+			thicknesses.append(thickness)
+
+	sheets = []
+	for thickness in thicknesses:
+		same = [(label, geometry) for label, part_thickness, geometry in parts if part_thickness == thickness]
+		sheets += [Sheet(thickness, placements) for placements in nest(same, sheet_size, **kwargs)]
+	return sheets
+
+@instrument()
+def write_sheets(sheets, output_dir, name, sheet_size, formats=('svg', 'dxf'), arc_tolerance=None, unplaced=()):
+	# <name>_<n>.svg/.dxf per sheet, drawn at full sheet size, and <name>.json listing
+	# the thickness of each sheet, where every part went and the labels of parts left off
+	filenames = []
+	manifest = []
+	for i, sheet in enumerate(sheets):
+		geometry = unary_union([placement.geometry for placement in sheet.placements])
+		for fmt in formats:
+			filename = os.path.join(output_dir, f"{name}_{i}.{fmt}")
+			write_cut(filename, geometry, arc_tolerance=arc_tolerance, bounds=(0, 0, *sheet_size))
+			filenames.append(filename)
+		manifest.append({
+			'sheet': i,
+			'thickness': sheet.thickness,
+			'parts': [{'label': placement.label, 'angle': placement.angle, 'offset': [round(v, 4) for v in placement.offset]}
+				for placement in sheet.placements],
+		})
+	remove_numbered(output_dir, name, formats, filenames)
+
+	filename = os.path.join(output_dir, f"{name}.json")
+	write_if_changed(filename, json.dumps({'sheet_size': list(sheet_size), 'sheets': manifest, 'unplaced': list(unplaced)}, indent=1) + "\n")
+	filenames.append(filename)
+	return filenames
@@ -0,0 +1,21 @@
+from py_keyboard_case.utils import U, key_list_corners, convex_hull
+from py_keyboard_case.port import Port, MicroUsbBreakout
+
+
+def keys_convex_hull_polygon(keys):
+	key_corners = key_list_corners(keys)
+
+	keys_convex_hull = convex_hull(key_corners)
+
+	return keys_convex_hull*U
+
+
+class NumPadPort(Port):
+	def __init__(self, *args, width=20, **kwargs):
+		super().__init__(*args, width=width, **kwargs)
+
+		left_micro_usb_x = -self.width/2 + MicroUsbBreakout.width/2 + 2
+
+		self.io_mods = [
+			MicroUsbBreakout(left_micro_usb_x, 0, self.mount_thickness),
+		]
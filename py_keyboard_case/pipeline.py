@@ -0,0 +1,239 @@
+from collections import namedtuple
+import math
+import os
+
+from py_keyboard_case.cache import content_hash
+from py_keyboard_case.resolution import DEFAULT_PROFILE, get_profile, resolution as use_resolution
+from py_keyboard_case.stages import Pipeline, source_fingerprint
+
+
+HOUSING_PARAMS = {
+	'plate_thickness': 4.7625,
+	'cavity_depth': 4*3.175,
+	'cavity_border': -1.5,
+	'wall_thickness': 8,
+	# screw points closer than this are merged, and more are added where the perimeter gap is longer than max
+	'screw_min_spacing': 10,
+	'screw_max_spacing': None,
+	# outlines are simplified within this many mm, and with outline_arcs rounded corners and
+	# holes are written as arcs in the .scad and .dxf files
+	'outline_tolerance': 0.01,
+	'outline_arcs': True,
+}
+
+# largest distance of a polyline vertex from the arc written in its place
+ARC_TOLERANCE = 0.001
+
+SHEET_PARAMS = {
+	# stock the laser layers are nested on, in mm. Only layers of the same thickness share a sheet
+	'sheet_width': 600,
+	'sheet_height': 400,
+	'sheet_margin': 5,
+	'sheet_spacing': 2,
+	'sheet_rotations': [0, 90, 180, 270],
+	# slide parts against the outlines already placed instead of only packing bounding boxes
+	'sheet_refine': False,
+}
+
+PLATE_LAYER_THICKNESSES = [3.175, 1.5875]
+
+EMIT_STAGES = ["emit_case", "emit_plate", "emit_sheets", "emit_blown_up", "emit_key_footprints"]
+
+GenerateResult = namedtuple('GenerateResult', ['files', 'stages', 'violations'])
+
+
+def case_layer_thicknesses(housing):
+	return [3.175]*math.ceil(housing.case.height/3.175)
+
+def build_pipeline(layout, output_dir, no_tilt=False, slice_plate_top=False, modules=True, housing=None, sheets=None, resolution=DEFAULT_PROFILE, rebuild=False, memory=None):
+	# stage graph for one KLE layout (json text) writing into output_dir.
+	# Geometry modules are imported by the stages that use them, so fully reused runs stay fast
+	housing_params = dict(HOUSING_PARAMS)
+	if housing is not None:
+		unknown = set(housing) - set(HOUSING_PARAMS)
+		if unknown:
+			raise ValueError(f"unknown housing parameters {sorted(unknown)}")
+		housing_params.update(housing)
+	sheet_params = dict(SHEET_PARAMS)
+	if sheets is not None:
+		unknown = set(sheets) - set(SHEET_PARAMS)
+		if unknown:
+			raise ValueError(f"unknown sheet parameters {sorted(unknown)}")
+		sheet_params.update(sheets)
+	arc_tolerance = ARC_TOLERANCE if housing_params['outline_arcs'] else None
+	# segment counts of every curved primitive, see py_keyboard_case.resolution
+	get_profile(resolution)
+
+	if no_tilt:
+		case_name = "case_no_tilt"
+	else:
+		case_name = "case"
+
+	if slice_plate_top:
+		plate_name = "plate_top"
+		slice_mode = "top"
+	else:
+		plate_name = "plate"
+		slice_mode = "bottom"
+
+	def build_keys():
+		from py_keyboard_case.key_table import KeyTable
+		return KeyTable.from_kle(layout)
+
+	def build_key_footprints(keys):
+		from py_keyboard_case.utils import key_plate_footprint, key_plate_footprint_dual_acrylic_solid
+		from py_keyboard_case.scad import UnionCollector
+
+		key_footprints = UnionCollector()
+		for key in keys:
+			key_footprints += key_plate_footprint(key, footprint_fn=key_plate_footprint_dual_acrylic_solid)
+		return key_footprints.get_solid()
+
+	def build_outline(keys):
+		from py_keyboard_case.redox import gen_key_midpoint_screw_point_location, redox_tight_square_elec_compartment_polygon
+
+		keys_filtered = keys[keys.x < 10]
+		keys_extent_verts = redox_tight_square_elec_compartment_polygon(keys_filtered)
+
+		mid_screw_point = gen_key_midpoint_screw_point_location(
+			keys_filtered[keys_filtered.rotation_angle == 0])
+
+		return keys_extent_verts, mid_screw_point
+
+	def build_housing(outline, key_footprints):
+		from py_keyboard_case.housing import Housing
+		from py_keyboard_case.redox import BertoDoxPort
+
+		keys_extent_verts, mid_screw_point = outline
+		return Housing(keys_extent_verts, key_footprints, port=BertoDoxPort(), aux_screw_points = [mid_screw_point], **housing_params)
+
+	def build_tilted_housing(housing):
+		from py_keyboard_case.tilt import Num10ScrewTilt
+
+		if no_tilt:
+			tilt_params = []
+		else:
+			tilt_params = [
+				# (tilt class, face num, placement, place_mode, height, normal),
+				(Num10ScrewTilt, 2, 12.989292131042735, "dist", 3*3.175, 1),
+				(Num10ScrewTilt, 2, -12.989292131042735, "dist", 3*3.175, 1),
+				(Num10ScrewTilt, 5, 12.989292131042735, "dist", 3*3.175, 1),
+				(Num10ScrewTilt, 6, -12.989292131042735, "dist", 3*3.175, 1),
+			]
+		return housing.with_tilt(tilt_params)
+
+	def check_interference(keys, housing):
+		from py_keyboard_case.interference import check_interference
+		# plain dicts, so reused runs unpickle them without importing the geometry modules
+		return [violation._asdict() for violation in check_interference(housing, keys)]
+
+	def emit_case(housing):
+		from py_keyboard_case.scad import write_solid
+		from py_keyboard_case.slicing import layer_groups, slice_write_solid
+		from py_keyboard_case.export import laser_write_layers
+		from py_keyboard_case.mesh import write_stl
+
+		case_solid_for_slicing = housing.get_case_solid(mode="laser", align="bottom")
+		case_layers = housing.get_case_layers(mode="laser", align="bottom")
+		layer_thicknesses = case_layer_thicknesses(housing)
+		# identical layers are cut once, sliced_<case_name>.json has the counts
+		groups = layer_groups(case_layers, layer_thicknesses)
+
+		files = slice_write_solid(case_solid_for_slicing, output_dir, case_name, layer_thicknesses, x_tile=300, y_tile=200, aspect_ratio=0.66, modules=modules, metrics=True, groups=groups)
+		files += laser_write_layers(case_layers, output_dir, case_name, layer_thicknesses, arc_tolerance=arc_tolerance, groups=groups)
+
+		case_stl = os.path.join(output_dir, f"{case_name}.stl")
+		write_stl(case_stl, housing.get_case_mesh())
+		files.append(case_stl)
+
+		files.append(write_solid(os.path.join(output_dir, f"{case_name}.scad"), housing.get_case_solid(), modules=modules, metrics=True))
+		return files
+
+	def emit_plate(housing):
+		from py_keyboard_case.scad import write_solid
+		from py_keyboard_case.slicing import layer_groups, slice_write_solid
+		from py_keyboard_case.export import laser_write_layers
+		from py_keyboard_case.mesh import write_stl
+
+		plate_solid_for_slicing = housing.get_plate_solid(mode="laser")
+		plate_layers = housing.get_plate_layers(mode="laser")
+		layer_thicknesses = PLATE_LAYER_THICKNESSES
+		groups = layer_groups(plate_layers, layer_thicknesses)
+
+		files = slice_write_solid(plate_solid_for_slicing, output_dir, plate_name, layer_thicknesses, slice_mode=slice_mode, modules=modules, metrics=True, groups=groups)
+		files += laser_write_layers(plate_layers, output_dir, plate_name, layer_thicknesses, slice_mode=slice_mode, arc_tolerance=arc_tolerance, groups=groups)
+
+		plate_stl = os.path.join(output_dir, "plate.stl")
+		write_stl(plate_stl, housing.get_plate_mesh())
+		files.append(plate_stl)
+
+		files.append(write_solid(os.path.join(output_dir, "plate.scad"), housing.get_plate_solid(), modules=modules, metrics=True))
+		files.append(write_solid(os.path.join(output_dir, "screw_test.scad"), housing.get_screw_solids(mode='laser'), modules=modules, metrics=True))
+		files.append(write_solid(os.path.join(output_dir, "port_negative.scad"), housing.port.get_solid(), modules=modules, metrics=True))
+		return files
+
+	def emit_sheets(housing):
+		from py_keyboard_case.export import layer_outlines
+		from py_keyboard_case.nesting import fits_sheet, nest_layers, write_sheets
+		from py_keyboard_case.slicing import layer_groups
+
+		# every laser layer of the case and plate, identical ones as many times as they are stacked
+		parts = []
+		for name, layers, layer_thicknesses, kwargs in [
+			(case_name, housing.get_case_layers(mode="laser", align="bottom"), case_layer_thicknesses(housing), {}),
+			(plate_name, housing.get_plate_layers(mode="laser"), PLATE_LAYER_THICKNESSES, {'slice_mode': slice_mode}),
+		]:
+			outlines = layer_outlines(layers, layer_thicknesses, **kwargs)
+			for group in layer_groups(layers, layer_thicknesses):
+				parts += [(f"{name}_{i}", layer_thicknesses[i], outlines[group[0]]) for i in group]
+
+		sheet_size = (sheet_params['sheet_width'], sheet_params['sheet_height'])
+		placement = dict(spacing=sheet_params['sheet_spacing'], margin=sheet_params['sheet_margin'], rotations=sheet_params['sheet_rotations'])
+		# a part bigger than the stock is left off the sheets, it still has its own laser files
+		unplaced = [label for label, _, geometry in parts if not fits_sheet(geometry, sheet_size, **placement)]
+		for label in unplaced:
+			print(f"SHEETS {label} does not fit on a {sheet_size[0]}x{sheet_size[1]}mm sheet, left off")
+		parts = [part for part in parts if part[0] not in unplaced]
+
+		sheets = nest_layers(parts, sheet_size, refine=sheet_params['sheet_refine'], **placement)
+		return write_sheets(sheets, output_dir, f"sheet_{case_name}_{plate_name}", sheet_size, arc_tolerance=arc_tolerance, unplaced=unplaced)
+
+	def emit_blown_up(housing):
+		from py_keyboard_case.scad import write_solid
+		return [write_solid(os.path.join(output_dir, "blown_up.scad"), housing.get_blown_up_solid(), modules=modules, metrics=True)]
+
+	def emit_key_footprints(key_footprints):
+		from py_keyboard_case.scad import write_solid
+		return [write_solid(os.path.join(output_dir, "key_plate_footprints.scad"), key_footprints, modules=modules, metrics=True)]
+
+	# each stage is only recomputed when its own parameters or an upstream stage changed
+	pipeline = Pipeline(os.path.join(output_dir, ".stages"), salt=source_fingerprint(), rebuild=rebuild, memory=memory)
+	pipeline.add("keys", build_keys, params=content_hash(layout))
+	pipeline.add("key_footprints", build_key_footprints, deps=["keys"], params=[resolution])
+	pipeline.add("outline", build_outline, deps=["keys"])
+	pipeline.add("housing", build_housing, deps=["outline", "key_footprints"], params=[housing_params, resolution])
+	pipeline.add("tilted_housing", build_tilted_housing, deps=["housing"], params=[no_tilt])
+	pipeline.add("interference", check_interference, deps=["keys", "tilted_housing"])
+	pipeline.add("emit_case", emit_case, deps=["tilted_housing"], params=[case_name, modules], emits=True)
+	pipeline.add("emit_plate", emit_plate, deps=["housing"], params=[plate_name, slice_mode, modules], emits=True)
+	pipeline.add("emit_sheets", emit_sheets, deps=["tilted_housing"], params=[case_name, plate_name, slice_mode, sheet_params, arc_tolerance], emits=True)
+	pipeline.add("emit_blown_up", emit_blown_up, deps=["tilted_housing"], params=[modules], emits=True)
+	pipeline.add("emit_key_footprints", emit_key_footprints, deps=["key_footprints"], params=[modules], emits=True)
+	return pipeline
+
+def generate(layout, output_dir, targets=EMIT_STAGES, check=True, **kwargs):
+	# write the outputs of `targets` for a KLE layout (json text), kwargs are passed to build_pipeline.
+	# With `check` the clearance between components is validated as well, see interference.py
+	os.makedirs(output_dir, exist_ok=True)
+	pipeline = build_pipeline(layout, output_dir, **kwargs)
+
+	files = []
+	violations = []
+	with use_resolution(kwargs.get('resolution', DEFAULT_PROFILE)):
+		if check:
+			violations = pipeline.run("interference")
+		for name in targets:
+			files += pipeline.run(name)
+	pipeline.save()
+
+	return GenerateResult(files, pipeline.log, violations)
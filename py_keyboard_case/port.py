@@ -5,6 +5,8 @@ from solid import *
 from solid.utils import *
 from py_keyboard_case.utils import rotate_point
 from py_keyboard_case.screws import ZiptiePairM2
+from py_keyboard_case.scad import UnionCollector
+from py_keyboard_case.layers import solid_to_layers
 
 class Port:
     def __init__(self, width=40, length=20, height=3.175, theta=0, mount_thickness=3.175, screw_left=False, screw_right=False):
@@ -37,15 +39,22 @@ class Port:
         return solid
 
     def get_io_solid(self, mode='stl'):
-        solid = union()
+        solid = UnionCollector()
         for io_mod in self.io_mods:
             solid += io_mod.get_solid(mode=mode)
-        
+        solid = solid.get_solid()
+
         solid =  rotate([0, 0, self.theta])(solid)
         solid = translate([self.x, self.y, self.z])(solid)
 
         return solid
 
+    def get_layers(self, mode='stl'):
+        return solid_to_layers(self.get_solid(mode=mode))
+
+    def get_io_layers(self, mode='stl'):
+        return solid_to_layers(self.get_io_solid(mode=mode))
+
     def get_side_screw_points(self, x_offset, y_offset):
         output = []
 
@@ -105,10 +114,14 @@ class MicroUsbBreakout:
 
         return solid
     
+    def get_layers(self, mode='stl'):
+        return solid_to_layers(self.get_solid(mode=mode))
+
     def get_screw_solids(self, mode='stl', local_ref=False):
-        screw_solid = union()
+        screw_solid = UnionCollector()
         for screw_obj in self.screws:
             screw_solid += screw_obj.get_solid(mode=mode)
+        screw_solid = screw_solid.get_solid()
 
         if not local_ref:
             screw_solid = translate([self.x, self.y, 0])(rotate([0, 0, self.theta])(screw_solid))
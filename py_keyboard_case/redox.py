@@ -0,0 +1,97 @@
+import numpy as np
+
+from py_keyboard_case.utils import U, key_arrays, key_table, key_list_corners, min_bounding_box, convex_hull, combine_polygon_verts
+from py_keyboard_case.port import Port, MicroUsbBreakout
+
+
+def gen_key_midpoint_screw_point_location(keys):
+	x, y, width, height, *_ = key_arrays(keys)
+	xs = (x + width/2) * U
+	ys = (y + height/2) * U
+
+	mid_x = 0.5*(np.max(xs) + np.min(xs))
+	mid_y = 0.5*(np.max(ys) + np.min(ys))
+
+	mid_key_idx = np.argmin((xs - mid_x)**2 + (ys - mid_y)**2)
+
+	mid_key_adjacent_approx = (xs[mid_key_idx], ys[mid_key_idx] - U)
+
+	mid_key_adjacent_idx = np.argmin((xs - mid_key_adjacent_approx[0])**2 + (ys - mid_key_adjacent_approx[1])**2)
+
+	screw_point = (0.5*(xs[mid_key_idx] + xs[mid_key_adjacent_idx]),
+		0.5*(ys[mid_key_idx] + ys[mid_key_adjacent_idx]))
+
+	return screw_point
+
+
+def redox_tight_square_polygon(keys):
+	keys = key_table(keys)
+	keys_square = keys[keys.rotation_angle == 0]
+	keys_thumb_cluster = keys[keys.rotation_angle == 30]
+
+	keys_square_corners = key_list_corners(keys_square)
+	keys_thumb_cluster_corners = key_list_corners(keys_thumb_cluster)
+
+	keys_sqaure_poly_verts = min_bounding_box(keys_square_corners)
+	keys_thumb_cluster_poly_verts = convex_hull(keys_thumb_cluster_corners)
+
+	min_x_idx = np.argmin(keys_thumb_cluster_poly_verts[:,0])
+	max_y_idx = np.argmax(keys_thumb_cluster_poly_verts[:,1])
+	thumb_cluster_extension_vec = keys_thumb_cluster_poly_verts[min_x_idx,:] - keys_thumb_cluster_poly_verts[max_y_idx,:]
+	keys_thumb_cluster_poly_verts[1,:] = keys_thumb_cluster_poly_verts[min_x_idx,:] + thumb_cluster_extension_vec
+
+	redox_polygon_verts = combine_polygon_verts(keys_sqaure_poly_verts, keys_thumb_cluster_poly_verts)
+	return redox_polygon_verts*U
+
+def redox_tight_square_elec_compartment_polygon(keys):
+	keys = key_table(keys)
+	keys_square = keys[keys.rotation_angle == 0]
+	keys_thumb_cluster = keys[keys.rotation_angle == 30]
+
+	keys_square_corners = key_list_corners(keys_square)
+	keys_thumb_cluster_corners = key_list_corners(keys_thumb_cluster)
+
+	keys_sqaure_poly_verts = min_bounding_box(keys_square_corners)
+	keys_thumb_cluster_poly_verts = convex_hull(keys_thumb_cluster_corners)
+
+	keys_thumb_cluster_poly_verts = keys_thumb_cluster_poly_verts[ 
+		[ 	np.argmin(keys_thumb_cluster_poly_verts[:,0]),
+			np.argmin(keys_thumb_cluster_poly_verts[:,1]),
+			np.argmax(keys_thumb_cluster_poly_verts[:,0]),
+			np.argmax(keys_thumb_cluster_poly_verts[:,1]),
+		], :]
+
+	min_x_idx = np.argmin(keys_thumb_cluster_poly_verts[:,0])
+	max_y_idx = np.argmax(keys_thumb_cluster_poly_verts[:,1])
+	thumb_cluster_extension_vec = keys_thumb_cluster_poly_verts[min_x_idx,:] - keys_thumb_cluster_poly_verts[max_y_idx,:]
+	keys_thumb_cluster_poly_verts[min_x_idx,:] = keys_thumb_cluster_poly_verts[min_x_idx,:] + thumb_cluster_extension_vec
+
+	redox_polygon_verts = combine_polygon_verts(keys_sqaure_poly_verts, keys_thumb_cluster_poly_verts)
+
+	# remove point above thumbcluster to make electrical comparment
+	redox_polygon_verts = redox_polygon_verts[redox_polygon_verts[:,1] != sorted(redox_polygon_verts[:,1])[3],:]
+
+	# extend elec compartment top to the max x
+	top_row_y = np.min(redox_polygon_verts[:,1])
+	top_row_max_x = np.max(redox_polygon_verts[redox_polygon_verts[:,1] ==  top_row_y, :])
+	max_x = np.max(redox_polygon_verts[:,0])
+
+	top_row_left_corner_idx = np.logical_and(redox_polygon_verts[:, 0] == top_row_max_x, redox_polygon_verts[:,1] == top_row_y)
+	redox_polygon_verts[top_row_left_corner_idx, 0] = max_x
+	
+	return redox_polygon_verts*U
+	
+
+class BertoDoxPort(Port):
+	def __init__(self, *args, height=6.35, **kwargs):
+		super().__init__(*args, height=height, **kwargs)
+
+		left_micro_usb_x = -self.width/2 + MicroUsbBreakout.width/2 + 2
+		right_micro_usb_x = left_micro_usb_x + MicroUsbBreakout.width + 2
+
+
+		self.io_mods = [
+			MicroUsbBreakout(left_micro_usb_x, 0, self.mount_thickness),
+			MicroUsbBreakout(right_micro_usb_x, 0, self.mount_thickness),
+			MicroUsbBreakout(left_micro_usb_x, -2*MicroUsbBreakout.length - 6, self.mount_thickness, theta=180),
+		]
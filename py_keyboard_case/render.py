@@ -0,0 +1,100 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shlex
+import subprocess
+import threading
+import time
+
+from py_keyboard_case.cache import content_hash, file_hash
+
+
+DEFAULT_RENDERER = "openscad -o {output} {input}"
+
+RenderResult = namedtuple('RenderResult', ['input', 'output', 'returncode', 'seconds', 'stderr'])
+
+
+def render_output_path(input, output_dir=None):
+	base, _ = os.path.splitext(input)
+	# cut projections are 2D, everything else renders to a mesh
+	ext = ".dxf" if base.endswith("_projection") else ".stl"
+	if output_dir is not None:
+		base = os.path.join(output_dir, os.path.basename(base))
+	return base + ext
+
+def render_command(command, input, output):
+	return [token.format(input=input, output=output) for token in shlex.split(command)]
+
+def render_artifacts(inputs, command=DEFAULT_RENDERER, jobs=None, output_dir=None, fail_fast=True, cache=None):
+	# render every artifact with `command` on a bounded pool of concurrent processes.
+	# With fail_fast the first failure stops queued renders and kills running ones.
+	# With an ArtifactCache, inputs already rendered by the same command are copied from it
+	jobs = jobs or os.cpu_count() or 1
+	stopped = threading.Event()
+	running = set()
+	# pids of the processes the pool killed itself
+	killed = set()
+	lock = threading.Lock()
+
+	def _render(input):
+		output = render_output_path(input, output_dir=output_dir)
+		if stopped.is_set():
+			return RenderResult(input, output, None, 0, "skipped")
+
+		start = time.perf_counter()
+		ext = os.path.splitext(output)[1]
+		if cache is not None:
+			key = content_hash(file_hash(input), command, ext)
+			if cache.fetch(key, ext, output):
+				return RenderResult(input, output, 0, time.perf_counter() - start, "cached")
+
+		try:
+			proc = subprocess.Popen(render_command(command, input, output),
+				stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+		except OSError as e:
+			if fail_fast:
+				stopped.set()
+			return RenderResult(input, output, -1, time.perf_counter() - start, str(e))
+
+		with lock:
+			running.add(proc)
+		try:
+			_, stderr = proc.communicate()
+		finally:
+			with lock:
+				running.discard(proc)
+
+		seconds = time.perf_counter() - start
+		if proc.returncode != 0 and proc.pid in killed:
+			# killed because another artifact failed first
+			return RenderResult(input, output, None, seconds, "cancelled")
+
+		result = RenderResult(input, output, proc.returncode, seconds, stderr)
+		if proc.returncode == 0 and cache is not None and os.path.exists(output):
+			cache.put(key, ext, output)
+		if proc.returncode != 0 and fail_fast:
+			stopped.set()
+			with lock:
+				for other in running:
+					if other.poll() is None:
+						killed.add(other.pid)
+						other.kill()
+		return result
+
+	with ThreadPoolExecutor(max_workers=jobs) as pool:
+		return list(pool.map(_render, inputs))
+
+def render_failed(results):
+	return [result for result in results if result.returncode not in (0, None)]
+
+def print_render_summary(results):
+	for result in results:
+		if result.returncode is None:
+			status = result.stderr
+		elif result.returncode == 0:
+			status = "cached" if result.stderr == "cached" else "ok"
+		else:
+			status = f"failed ({result.returncode})"
+		print(f"{result.seconds:8.2f}s  {status:12s} {result.input} -> {result.output}")
+		if result.returncode not in (0, None) and result.stderr:
+			print(result.stderr.strip())
@@ -0,0 +1,45 @@
+from contextlib import contextmanager
+import math
+
+
+# tolerance is the largest distance in mm allowed between a facet and the true circle.
+# Segment counts follow from it per radius, clamped to [min_segments, max_segments]
+PROFILES = {
+	'draft': {'tolerance': 0.1, 'min_segments': 8, 'max_segments': 32},
+	'production': {'tolerance': 0.005, 'min_segments': 24, 'max_segments': 200},
+}
+
+DEFAULT_PROFILE = 'production'
+
+_profile = DEFAULT_PROFILE
+
+
+def get_profile(name):
+	if name not in PROFILES:
+		raise ValueError(f"unknown resolution profile '{name}', expected one of {sorted(PROFILES)}")
+	return PROFILES[name]
+
+def active_profile():
+	return _profile
+
+@contextmanager
+def resolution(name):
+	# curved primitives built inside the block use profile `name`
+	global _profile
+	get_profile(name)
+	previous = _profile
+	_profile = name
+	try:
+		yield
+	finally:
+		_profile = previous
+
+def segments_for_radius(r, profile=None):
+	# fewest segments whose chord error, r * (1 - cos(pi / n)), stays within the profile tolerance
+	profile = get_profile(profile or _profile)
+	tolerance = profile['tolerance']
+	if r <= tolerance:
+		segments = profile['min_segments']
+	else:
+		segments = math.ceil(math.pi / math.acos(1 - tolerance / r))
+	return max(profile['min_segments'], min(profile['max_segments'], segments))
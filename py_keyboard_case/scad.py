@@ -0,0 +1,300 @@
+from copy import copy
+import hashlib
+import io
+
+from solid import union
+
+from py_keyboard_case.cache import streamed_write
+from py_keyboard_case.instrument import section
+from solid.solidpython import OpenSCADObject, non_rendered_classes, _find_include_strings
+
+
+class UnionCollector:
+	# gathers children and emits a single flat union instead of nesting one level per +=
+	def __init__(self, *children):
+		self.children = list(children)
+
+	def add(self, solid):
+		self.children.append(solid)
+		return self
+
+	def __iadd__(self, solid):
+		return self.add(solid)
+
+	def __len__(self):
+		return len(self.children)
+
+	def get_solid(self):
+		return union()(*self.children)
+
+
+def _is_plain_union(solid):
+	return (solid.name == 'union' and not solid.params and not solid.modifier
+		and not solid.is_hole and not solid.is_part_root)
+
+def flatten_unions(solid):
+	# copy of solid with unions nested directly inside unions folded into their parent.
+	# The caller's tree is left as it was: only nodes on a path to a fold are copied, every
+	# other subtree is shared. Walks the tree iteratively since chained += trees are deep
+	# enough to hit the recursion limit
+	rebuilt = {}
+	copies = set()
+	stack = [(solid, False)]
+	while stack:
+		node, children_done = stack.pop()
+		if id(node) in rebuilt:
+			continue
+		if not children_done:
+			stack.append((node, True))
+			stack.extend((child, False) for child in node.children if id(child) not in rebuilt)
+			continue
+
+		children = [rebuilt[id(child)] for child in node.children]
+		if node.name == 'union' and any(_is_plain_union(child) for child in children):
+			flat = []
+			pending = list(reversed(children))
+			while pending:
+				child = pending.pop()
+				if _is_plain_union(child):
+					pending.extend(reversed(child.children))
+				else:
+					flat.append(child)
+			children = flat
+
+		if len(children) == len(node.children) and all(a is b for a, b in zip(children, node.children)):
+			rebuilt[id(node)] = node
+			continue
+
+		node_copy = copy(node)
+		node_copy.children = children
+		copies.add(id(node_copy))
+		for child in children:
+			# copies belong to the new tree. Shared children keep their original parent, which is
+			# never None, and whether it is None is all the renderer looks at
+			if id(child) in copies:
+				child.parent = node_copy
+		rebuilt[id(node)] = node_copy
+
+	return rebuilt[id(solid)]
+
+def write_solid(filename, solid, modules=False, metrics=False, file_header=''):
+	# the .scad text is streamed to disk as the tree is walked, never held as one string.
+	# A filename ending in .gz is written gzip compressed
+	solid = flatten_unions(solid)
+	if metrics:
+		# measured on the flattened tree, the one OpenSCAD gets
+		from py_keyboard_case.complexity import write_metrics
+		write_metrics(filename, solid)
+
+	with section("scad_render"), streamed_write(filename, compress=filename.endswith(".gz")) as f:
+		if modules:
+			stream_render_modules(solid, f, file_header=file_header)
+		else:
+			stream_render(solid, f, file_header=file_header)
+
+	return filename
+
+
+# actions of the render stack in _stream_nodes
+_WRITE, _NODE, _HOLES, _DEPTH, _IN_HOLES = range(5)
+
+class _ScadStream:
+	# applies the indentation and hole rewriting that nested OpenSCADObject._render calls
+	# do to their strings, to each piece as it is written
+	def __init__(self, out):
+		self.out = out
+		self.depth = 0
+		self.in_holes = 0
+
+	def write(self, s):
+		if self.in_holes:
+			s = s.replace("intersection", "union").replace("difference", "union")
+		if self.depth:
+			s = s.replace("\n", "\n" + "\t" * self.depth)
+		self.out.write(s)
+
+def _node_actions(node, render_holes):
+	# OpenSCADObject._render as a list of actions, children are rendered by later stack entries
+	hole_children = node.find_hole_children() if not node.parent or node.is_part_root else []
+	children = [(_NODE, child, render_holes) for child in node.children if render_holes or not child.is_hole]
+
+	actions = []
+	if hole_children:
+		actions += [(_WRITE, "\ndifference(){", None), (_DEPTH, 1, None)]
+
+	if node.name in non_rendered_classes:
+		actions += children
+	elif not node.children:
+		actions.append((_WRITE, node._render_str_no_children() + ";", None))
+	else:
+		actions += [(_WRITE, node._render_str_no_children() + " {", None), (_DEPTH, 1, None)]
+		actions += children
+		actions += [(_DEPTH, -1, None), (_WRITE, "\n}", None)]
+
+	if hole_children:
+		actions += [(_WRITE, "\n/* Holes Below*/", None), (_IN_HOLES, 1, None), (_HOLES, node, None), (_IN_HOLES, -1, None)]
+		actions += [(_DEPTH, -1, None), (_WRITE, " /* End Holes */ \n}", None)]
+	return actions
+
+def _hole_actions(node):
+	# OpenSCADObject._render_hole_children as a list of actions
+	if not node.has_hole_children:
+		return []
+
+	actions = []
+	for child in node.children:
+		if child.is_hole:
+			actions.append((_NODE, child, True))
+		elif child.has_hole_children:
+			actions.append((_HOLES, child, None))
+
+	if node.name in non_rendered_classes:
+		return actions
+	return [(_WRITE, node._render_str_no_children() + "{", None), (_DEPTH, 1, None)] + actions + [(_DEPTH, -1, None), (_WRITE, "\n}", None)]
+
+def _stream_nodes(solid, stream, depth=0):
+	# writes what solid._render() returns, indented `depth` levels, without recursion
+	stack = [(_DEPTH, -depth, None), (_NODE, solid, False), (_DEPTH, depth, None)]
+	while stack:
+		action, value, render_holes = stack.pop()
+		if action == _WRITE:
+			stream.write(value)
+		elif action == _DEPTH:
+			stream.depth += value
+		elif action == _IN_HOLES:
+			stream.in_holes += value
+		elif action == _NODE:
+			stack.extend(reversed(_node_actions(value, render_holes)))
+		else:
+			stack.extend(reversed(_hole_actions(value)))
+
+def _stream_header(solid, out, file_header):
+	if file_header and not file_header.endswith('\n'):
+		file_header += '\n'
+	out.write(file_header + ''.join(_find_include_strings(solid)) + "\n")
+
+def stream_render(solid, out, file_header=''):
+	# same text as solid's scad_render, written to the file object `out` piece by piece
+	_stream_header(solid, out, file_header)
+	_stream_nodes(solid, _ScadStream(out))
+
+
+def _hash_tree(solid):
+	# structural hash, subtree node count and "has holes that escape to an ancestor"
+	# for every node, computed bottom up without recursion
+	keys, sizes, escaping = {}, {}, {}
+	stack = [(solid, False)]
+	while stack:
+		node, children_done = stack.pop()
+		if id(node) in keys:
+			continue
+		if not children_done:
+			stack.append((node, True))
+			stack.extend((child, False) for child in node.children if id(child) not in keys)
+			continue
+
+		h = hashlib.sha1()
+		h.update(node._render_str_no_children().encode())
+		h.update(f"{node.is_hole}{node.is_part_root}".encode())
+		for child in node.children:
+			h.update(keys[id(child)].encode())
+
+		keys[id(node)] = h.hexdigest()
+		sizes[id(node)] = 1 + sum(sizes[id(child)] for child in node.children)
+		escaping[id(node)] = node.is_hole or (not node.is_part_root and any(escaping[id(child)] for child in node.children))
+
+	return keys, sizes, escaping
+
+def _count_subtrees(roots, keys, modules):
+	# count each subtree as it would appear once modules are in place:
+	# a module body is walked once no matter how often it is called
+	counts = {}
+	bodies = {}
+	stack = list(roots)
+	while stack:
+		node = stack.pop()
+		key = keys[id(node)]
+		counts[key] = counts.get(key, 0) + 1
+		if node.is_hole:
+			continue
+		if key in modules:
+			if key in bodies:
+				continue
+			bodies[key] = node
+		stack.extend(node.children)
+	return counts, bodies
+
+def _select_modules(solid, keys, sizes, escaping, min_size):
+	modules = set()
+	for _ in range(8):
+		counts, bodies = _count_subtrees([solid], keys, modules)
+		eligible = {}
+		stack = [solid]
+		while stack:
+			node = stack.pop()
+			if node.is_hole:
+				continue
+			if sizes[id(node)] >= min_size and not escaping[id(node)]:
+				eligible[keys[id(node)]] = node
+			stack.extend(node.children)
+
+		selected = {key for key, node in eligible.items() if counts[key] >= 2 and node is not solid}
+		if selected == modules:
+			break
+		modules = selected
+
+	_, bodies = _count_subtrees([solid], keys, modules)
+	return {key: bodies[key] for key in modules if key in bodies}
+
+def scad_render_modules(solid, file_header='', min_size=2, prefix='m'):
+	# like scad_render, but every subtree that appears more than once is emitted a
+	# single time as an OpenSCAD module and each use becomes a module call
+	out = io.StringIO()
+	stream_render_modules(solid, out, file_header=file_header, min_size=min_size, prefix=prefix)
+	return out.getvalue()
+
+def stream_render_modules(solid, out, file_header='', min_size=2, prefix='m'):
+	# scad_render_modules written to the file object `out` piece by piece
+	solid = flatten_unions(solid)
+	keys, sizes, escaping = _hash_tree(solid)
+	modules = _select_modules(solid, keys, sizes, escaping, min_size)
+
+	if not modules:
+		stream_render(solid, out, file_header=file_header)
+		return
+
+	names = {key: f"{prefix}_{key[:12]}" for key in modules}
+
+	# swap repeated children for module calls in place, restored once rendered
+	swapped = []
+	visited = set()
+	stack = [solid] + list(modules.values())
+	while stack:
+		node = stack.pop()
+		if id(node) in visited or node.is_hole:
+			continue
+		visited.add(id(node))
+		for i, child in enumerate(node.children):
+			key = keys[id(child)]
+			if key in names:
+				call = OpenSCADObject(names[key], {})
+				call.set_parent(node)
+				swapped.append((node, i, child))
+				node.children[i] = call
+			else:
+				stack.append(child)
+
+	try:
+		stream = _ScadStream(out)
+		out.write(file_header)
+		for key, body in sorted(modules.items(), key=lambda item: names[item[0]]):
+			out.write(f"\nmodule {names[key]}() {{")
+			_stream_nodes(body, stream, depth=1)
+			out.write("\n}\n")
+
+		# the definitions end in a newline, so the header gets none added
+		out.write(''.join(_find_include_strings(solid)) + "\n")
+		_stream_nodes(solid, stream)
+	finally:
+		for node, i, child in swapped:
+			node.children[i] = child
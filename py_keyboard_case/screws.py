@@ -1,10 +1,10 @@
-from turtle import position
-from matplotlib.pyplot import axis
 from solid import *
 from solid.utils import *
 from shapely.geometry import Polygon as ShapelyPolygon
 from shapely.geometry import LineString
 from py_keyboard_case.utils import *
+from py_keyboard_case.mesh import lathe_mesh
+from py_keyboard_case.resolution import segments_for_radius
 
 
 class Screw(Obj3D):
@@ -19,18 +19,33 @@ class Screw(Obj3D):
 			diameter = self.diameter[mode]
 		else:
 			diameter = self.diameter
-		shaft = down(self.length)(cylinder(h=self.length, r=diameter/2, segments=100))
+		shaft = down(self.length)(cylinder(h=self.length, r=diameter/2, segments=segments_for_radius(diameter/2)))
 		head = self.head.get_solid(mode=mode)
 
 		screw_solid = part()(shaft + head)
 
 		return screw_solid
 
+	def _get_mesh(self, mode):
+		head_profile = self.head.get_profile(mode=mode)
+		if head_profile is None:
+			return super()._get_mesh(mode)
+
+		diameter = self.diameter[mode] if isinstance(self.diameter, dict) else self.diameter
+		shaft_top = head_profile[0][0] if head_profile else 0
+		profile = [(-self.length, diameter/2), (shaft_top, diameter/2)] + head_profile
+
+		return lathe_mesh(profile, segments=segments_for_radius(max(r for _, r in profile)))
+
 
 class ScrewHead:
 	def get_solid(self, mode='stl'):
 		return union()()
 
+	def get_profile(self, mode='stl'):
+		# (z, r) points from bottom to top when the head is a solid of revolution, else None
+		return []
+
 
 class ScrewHeadMulti:
 	def __init__(self, head_map):
@@ -39,6 +54,9 @@ class ScrewHeadMulti:
 	def get_solid(self, mode='stl'):
 		return self.head_map.get(mode, ScrewHead()).get_solid(mode=mode)
 
+	def get_profile(self, mode='stl'):
+		return self.head_map.get(mode, ScrewHead()).get_profile(mode=mode)
+
 
 class FlatHead(ScrewHead):
 	def __init__(self, diameter_top, diameter_bottom, height):
@@ -47,14 +65,22 @@ class FlatHead(ScrewHead):
 		self.height = height
 
 	def get_solid(self, mode=None):
-		solid = cylinder(r2=self.diameter_top/2, r1=self.diameter_bottom/2, h=self.height, segments=100)
+		solid = cylinder(r2=self.diameter_top/2, r1=self.diameter_bottom/2, h=self.height, segments=segments_for_radius(max(self.diameter_top, self.diameter_bottom)/2))
 		return down(self.height)(solid)
 
+	def get_profile(self, mode=None):
+		return [(-self.height, self.diameter_bottom/2), (0, self.diameter_top/2)]
+
 class FlatHeadLaser(FlatHead):
 	def get_solid(self, mode=None):
-		solid = cylinder(r=self.diameter_top/2, h=self.height, segments=100) - hole()(cylinder(r=self.diameter_bottom/2, h=self.height, segments=100))
+		solid = cylinder(r=self.diameter_top/2, h=self.height, segments=segments_for_radius(self.diameter_top/2)) - \
+			hole()(cylinder(r=self.diameter_bottom/2, h=self.height, segments=segments_for_radius(self.diameter_bottom/2)))
 		return down(self.height)(solid)
 
+	def get_profile(self, mode=None):
+		# the hole cuts through the shaft, not a solid of revolution
+		return None
+
 class M2Screw(Screw):
 	def __init__(self, length, head_type="flat", tolerance='low', **kwargs):
 		if head_type == "flat":
@@ -98,11 +124,12 @@ class ZiptiePair(Obj3D):
 
 	def _get_solid(self, mode):
 
-		hole_solids = left(self.pair_dist/2)(cylinder(r=self.hole_diameter/2, h=self.length, segments=100)) + \
-					  right(self.pair_dist/2)(cylinder(r=self.hole_diameter/2, h=self.length, segments=100))
+		segments = segments_for_radius(self.hole_diameter/2)
+		hole_solids = left(self.pair_dist/2)(cylinder(r=self.hole_diameter/2, h=self.length, segments=segments)) + \
+					  right(self.pair_dist/2)(cylinder(r=self.hole_diameter/2, h=self.length, segments=segments))
 
 		head_line = LineString([(-self.pair_dist/2, 0, 0), (self.pair_dist/2, 0, 0)])
-		head_verts = head_line.buffer(self.head_diameter/2).exterior.xy
+		head_verts = head_line.buffer(self.head_diameter/2, quad_segs=max(segments_for_radius(self.head_diameter/2) // 4, 1)).exterior.xy
 		head_solid = linear_extrude(self.head_length, convexity=10)(
 					polygon(array2tuples(np.stack((head_verts[0], head_verts[1]), axis=1)))
 				)
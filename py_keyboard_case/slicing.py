@@ -0,0 +1,98 @@
+import json
+import math
+import os
+
+import shapely
+from solid import cube, intersection, projection
+from solid.utils import up, down, right, forward
+
+from py_keyboard_case.cache import content_hash, write_if_changed
+from py_keyboard_case.layers import Z_DECIMALS
+from py_keyboard_case.scad import UnionCollector, write_solid
+from py_keyboard_case.instrument import instrument
+
+
+def slice_write_solid(solid, output_dir, name, layer_thicknesses, modules=False, metrics=False, groups=None, **kwargs):
+	# with `groups` (see layer_groups) each distinct layer is cut once, and
+	# sliced_<name>.json lists how many of it to make
+	sliced_solid = slice_solid(solid, layer_thicknesses, groups=groups, **kwargs)
+	header = layer_header(layer_thicknesses, groups) if groups is not None else ''
+
+	files = [
+		write_solid(os.path.join(output_dir, f"sliced_{name}.scad"), sliced_solid, modules=modules, metrics=metrics, file_header=header),
+		write_solid(os.path.join(output_dir, f"sliced_{name}_projection.scad"), projection(cut=True)(sliced_solid), modules=modules, metrics=metrics, file_header=header),
+	]
+	if groups is not None:
+		files.append(write_layer_manifest(os.path.join(output_dir, f"sliced_{name}.json"), layer_thicknesses, groups))
+	return files
+
+def _layer_z(layer_thicknesses, slice_mode="bottom"):
+	# bottom of the cube slice_layer intersects with, for each layer
+	z = 0
+	layer_z = []
+	for layer_thickness in layer_thicknesses:
+		if slice_mode == "top":
+			z += layer_thickness
+		layer_z.append(z)
+		if slice_mode == "bottom":
+			z += layer_thickness
+	return layer_z
+
+@instrument()
+def layer_groups(layers, layer_thicknesses, jitter_dist=0.01):
+	# indices of the layers that come out identical, in order of first appearance: same thickness
+	# and the same slabs of the LayeredSolid `layers` relative to the layer bottom. Slabs within
+	# jitter_dist of a layer face are ignored, the cuts are moved off the faces by that much
+	groups = {}
+	z = 0
+	for i, layer_thickness in enumerate(layer_thicknesses):
+		z_min = z + (jitter_dist or 0)
+		z += layer_thickness
+		parts = [repr(layer_thickness)]
+		for slab in layers.section(z_min, z - (jitter_dist or 0)):
+			parts.append(repr((round(slab.z_min - z_min, Z_DECIMALS), round(slab.z_max - z_min, Z_DECIMALS))))
+			parts.append(shapely.normalize(slab.geometry).wkb)
+		groups.setdefault(content_hash(*parts), []).append(i)
+	return list(groups.values())
+
+def layer_header(layer_thicknesses, groups):
+	# one comment line per distinct layer, in the order they are tiled
+	return "".join(f"// layer {group[0]}: {layer_thicknesses[group[0]]:g} mm, cut {len(group)}x (layers {', '.join(map(str, group))})\n" for group in groups)
+
+def write_layer_manifest(filename, layer_thicknesses, groups):
+	manifest = {
+		'layer_count': len(layer_thicknesses),
+		'layers': [{'index': group[0], 'thickness': layer_thicknesses[group[0]], 'count': len(group), 'layers': group} for group in groups],
+	}
+	write_if_changed(filename, json.dumps(manifest, indent=1) + "\n")
+	return filename
+
+@instrument()
+def slice_solid(solid, layer_thicknesses, x_tile=300, y_tile=300, aspect_ratio = 1.5, slice_mode="bottom", jitter_dist=0.01, groups=None):
+	# `groups` keeps only the first layer of each group, tiled in group order
+	assert slice_mode == "bottom" or slice_mode == "top", "slice mode must be either bottom or top"
+	indices = [group[0] for group in groups] if groups is not None else range(len(layer_thicknesses))
+	num_x = math.ceil(math.sqrt(len(indices) * aspect_ratio * y_tile / x_tile ))
+	num_y = math.ceil(len(indices)/num_x)
+
+	if jitter_dist:
+		if slice_mode == "bottom":
+			solid = down(jitter_dist)(solid)
+		else:
+			solid = up(jitter_dist)(solid)
+
+	layer_z = _layer_z(layer_thicknesses, slice_mode)
+	sliced_layers_solid = UnionCollector()
+	for tile, i in enumerate(indices):
+		x_offset = x_tile*(tile%num_x)
+		y_offset = y_tile*math.floor(tile/num_x)
+		sliced_layer = slice_layer(solid, layer_thicknesses[i], layer_z[i])
+		sliced_layer = right(x_offset)(forward(y_offset)(sliced_layer))
+		sliced_layers_solid += sliced_layer
+
+	return sliced_layers_solid.get_solid()
+
+def slice_layer(solid, layer_thickness, z):
+	layer = up(z)(up(layer_thickness/2)(cube([2000, 2000, layer_thickness], center=True)))
+	sliced_layer = down(z)(intersection()(solid, layer))
+	return sliced_layer
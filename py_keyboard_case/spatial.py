@@ -0,0 +1,47 @@
+import math
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
+
+def thin_points(points, min_spacing, fixed=0):
+	# greedy in order: keep a point, then drop every later point within min_spacing of it.
+	# The first `fixed` points are always kept, they only suppress the others
+	points = np.asarray(points, dtype=float).reshape(-1, 2)
+	if len(points) == 0:
+		return points
+
+	tree = STRtree(shapely.points(points))
+	dropped = np.zeros(len(points), dtype=bool)
+	kept = []
+	for i in range(len(points)):
+		if dropped[i] and i >= fixed:
+			continue
+		kept.append(i)
+		near = tree.query(shapely.Point(points[i]), predicate='dwithin', distance=min_spacing)
+		dropped[near[near > i]] = True
+
+	return points[kept]
+
+def space_along_ring(ring, points, max_spacing):
+	# points on `ring` plus evenly spaced extra ones wherever two neighbours along it
+	# are more than max_spacing apart, in ring order
+	points = np.asarray(points, dtype=float).reshape(-1, 2)
+	if len(points) == 0:
+		points = np.array([ring.coords[0]])
+
+	positions = ring.project(shapely.points(points))
+	order = np.argsort(positions)
+	positions = positions[order]
+	# each gap runs from a point to the next one, the last wraps around to the first
+	gaps = np.diff(np.append(positions, positions[0] + ring.length))
+
+	result = []
+	for i, position, gap in zip(order, positions, gaps):
+		result.append(points[i])
+		count = math.ceil(gap / max_spacing)
+		for j in range(1, count):
+			result.append(ring.interpolate((position + gap * j / count) % ring.length).coords[0])
+
+	return np.array(result)
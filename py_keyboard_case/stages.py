@@ -0,0 +1,165 @@
+from collections import OrderedDict
+import glob
+import json
+import os
+import pickle
+import time
+
+from py_keyboard_case.cache import atomic_write, content_hash, file_hash
+from py_keyboard_case.instrument import section
+
+
+def source_fingerprint(*filenames):
+	# any edit to the package (or the calling script) invalidates every stage
+	package_dir = os.path.dirname(os.path.abspath(__file__))
+	filenames = sorted(glob.glob(os.path.join(package_dir, "*.py"))) + list(filenames)
+	return content_hash(*[file_hash(filename) for filename in filenames])
+
+def params_fingerprint(params):
+	# classes and functions fingerprint by their qualified name through repr
+	return json.dumps(params, sort_keys=True, default=repr)
+
+
+def print_stage_summary(log):
+	for name, status, seconds in log:
+		print(f"{seconds:8.2f}s  {status:8s} {name}")
+
+
+class StageMemory:
+	# stage values kept in process by fingerprint, so a long lived process skips unpickling too.
+	# Least recently used values are dropped past max_entries
+	def __init__(self, max_entries=64):
+		self.max_entries = max_entries
+		self.values = OrderedDict()
+
+	def __contains__(self, fingerprint):
+		return fingerprint in self.values
+
+	def get(self, fingerprint):
+		self.values.move_to_end(fingerprint)
+		return self.values[fingerprint]
+
+	def put(self, fingerprint, value):
+		self.values[fingerprint] = value
+		self.values.move_to_end(fingerprint)
+		while len(self.values) > self.max_entries:
+			self.values.popitem(last=False)
+
+
+class Stage:
+	def __init__(self, name, fn, deps=(), params=None, emits=False):
+		self.name = name
+		self.fn = fn
+		self.deps = list(deps)
+		self.params = params
+		# emitting stages write files and return their names, the rest return a value that is pickled
+		self.emits = emits
+
+
+class Pipeline:
+	# stages keyed by a fingerprint of their params and upstream fingerprints, persisted in `directory`.
+	# A rerun only recomputes stages whose fingerprint changed, upstream values are loaded on demand
+	manifest_name = "graph.json"
+
+	def __init__(self, directory, salt="", rebuild=False, memory=None):
+		self.directory = directory
+		self.salt = salt
+		self.memory = memory
+		self.stages = {}
+		self.values = {}
+		self.fingerprints = {}
+		self.log = []
+
+		os.makedirs(self.directory, exist_ok=True)
+		self.manifest = {}
+		manifest_path = os.path.join(self.directory, self.manifest_name)
+		if not rebuild and os.path.exists(manifest_path):
+			with open(manifest_path, 'r') as f:
+				self.manifest = json.load(f)
+
+	def add(self, name, fn, deps=(), params=None, emits=False):
+		if name in self.stages:
+			raise ValueError(f"stage '{name}' already exists")
+		for dep in deps:
+			if dep not in self.stages:
+				raise ValueError(f"stage '{name}' depends on unknown stage '{dep}'")
+		self.stages[name] = Stage(name, fn, deps=deps, params=params, emits=emits)
+
+	def fingerprint(self, name):
+		if name not in self.fingerprints:
+			stage = self.stages[name]
+			self.fingerprints[name] = content_hash(self.salt, name, params_fingerprint(stage.params),
+				*[self.fingerprint(dep) for dep in stage.deps])
+		return self.fingerprints[name]
+
+	def value_path(self, name):
+		return os.path.join(self.directory, f"{name}.pkl")
+
+	def _load(self, name):
+		entry = self.manifest.get(name)
+		if entry is None or entry['fingerprint'] != self.fingerprint(name):
+			return False, None
+
+		if self.stages[name].emits:
+			if all(os.path.exists(filename) for filename in entry['outputs']):
+				return True, entry['outputs']
+			return False, None
+
+		try:
+			with open(self.value_path(name), 'rb') as f:
+				return True, pickle.load(f)
+		except Exception:
+			# missing or unreadable after a code change, just recompute
+			return False, None
+
+	def _store(self, name, value, seconds):
+		stage = self.stages[name]
+		entry = {
+			'fingerprint': self.fingerprint(name),
+			'deps': stage.deps,
+			'seconds': seconds,
+		}
+		if stage.emits:
+			entry['outputs'] = list(value)
+		else:
+			atomic_write(self.value_path(name), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+		self.manifest[name] = entry
+
+	def run(self, name):
+		if name in self.values:
+			return self.values[name]
+
+		start = time.perf_counter()
+		stage = self.stages[name]
+		fingerprint = self.fingerprint(name)
+		if self.memory is not None and not stage.emits and fingerprint in self.memory:
+			value = self.memory.get(fingerprint)
+			self.log.append((name, "warm", time.perf_counter() - start))
+			self.values[name] = value
+			return value
+
+		found, value = self._load(name)
+		if found:
+			self.log.append((name, "reused", time.perf_counter() - start))
+		else:
+			inputs = [self.run(dep) for dep in stage.deps]
+			# forget the old result first, so a build interrupted while writing is never taken as current
+			if self.manifest.pop(name, None) is not None:
+				self.save()
+			start = time.perf_counter()
+			with section(f"stage.{name}"):
+				value = stage.fn(*inputs)
+			seconds = time.perf_counter() - start
+			self._store(name, value, seconds)
+			self.log.append((name, "built", seconds))
+
+		if self.memory is not None and not stage.emits:
+			self.memory.put(fingerprint, value)
+		self.values[name] = value
+		return value
+
+	def save(self):
+		atomic_write(os.path.join(self.directory, self.manifest_name), json.dumps(self.manifest, indent=1, sort_keys=True).encode())
+
+	def print_summary(self):
+		print_stage_summary(self.log)
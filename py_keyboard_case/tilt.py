@@ -1,4 +1,3 @@
-from os import major
 from solid import *
 from solid.utils import *
 from copy import deepcopy
@@ -6,6 +5,8 @@ from copy import deepcopy
 import numpy as np
 
 from py_keyboard_case.utils import Obj3D
+from py_keyboard_case.mesh import lathe_mesh
+from py_keyboard_case.resolution import segments_for_radius
 
 class HexNut(Obj3D):
     def __init__(self, height, major_diameter=None, minor_diameter=None, **kwargs):
@@ -28,6 +29,9 @@ class HexNut(Obj3D):
 
         return solid
 
+    def _get_mesh(self, mode):
+        return lathe_mesh([(0, self.major_diameter/2), (self.height, self.major_diameter/2)], segments=6)
+
 
 class Num10HexNut(HexNut):
     def __init__(self, height=3.175, **kwargs):
@@ -52,7 +56,7 @@ class ScrewTilt(Obj3D):
     def _get_solid(self, mode):
         
         self.buffer_radius = self.buffer_diameter/2
-        solid = forward(self.buffer_radius)(cylinder(r=self.buffer_radius, h=self.height, segments=100))
+        solid = forward(self.buffer_radius)(cylinder(r=self.buffer_radius, h=self.height, segments=segments_for_radius(self.buffer_radius)))
 
         trap = self._get_trap(self.buffer_radius)
 
@@ -61,7 +65,7 @@ class ScrewTilt(Obj3D):
         for nut in self.hex_nuts:
             solid -= nut.get_solid(mode=mode)
 
-        solid -= forward(self.buffer_radius)(down(1)(cylinder(r=self.shaft_diameter/2, h=self.height+2, segments=100)))
+        solid -= forward(self.buffer_radius)(down(1)(cylinder(r=self.shaft_diameter/2, h=self.height+2, segments=segments_for_radius(self.shaft_diameter/2))))
 
         return solid
 
@@ -7,6 +7,12 @@ from shapely.geometry import Polygon as ShapelyPolygon
 from shapely.geometry import MultiPoint
 from shapely.ops import unary_union
 
+from py_keyboard_case.key_table import KeyTable
+from py_keyboard_case.instrument import section
+from py_keyboard_case.layers import solid_to_layers
+from py_keyboard_case.mesh import layers_to_mesh, transform_mesh
+from py_keyboard_case.resolution import segments_for_radius
+
 
 U = 19.05
 KEYCAP_LEN = 18
@@ -25,8 +31,9 @@ class Obj3D(ABC):
 		self.rotation = rotation.copy()
 
 	def get_solid(self, mode='stl'):
-		solid = self._get_solid(mode)
-		solid = self._translate_solid(solid)
+		with section(f"{type(self).__name__}.get_solid"):
+			solid = self._get_solid(mode)
+			solid = self._translate_solid(solid)
 		return solid
 
 	def _translate_solid(self, solid):
@@ -34,6 +41,15 @@ class Obj3D(ABC):
 		solid = translate(self.position)(solid)
 		return solid
 
+	def get_layers(self, mode='stl'):
+		return solid_to_layers(self.get_solid(mode=mode))
+
+	def get_mesh(self, mode='stl'):
+		return transform_mesh(self._get_mesh(mode), position=self.position, rotation=self.rotation)
+
+	def _get_mesh(self, mode):
+		return layers_to_mesh(solid_to_layers(self._get_solid(mode)))
+
 	@abstractmethod
 	def _get_solid(self, mode):
 		raise NotImplementedError
@@ -52,7 +68,7 @@ def key_plate_footpint_endmill_corners_solid(endmill_diameter=3.4):
 		for y_sign in [-1, 1]:
 			y = y_sign * y_offset
 
-			cyl_solid = cylinder(h=h, r=r, segments=100)
+			cyl_solid = cylinder(h=h, r=r, segments=segments_for_radius(r))
 			cyl_solid = translate([x,y,-h])(cyl_solid)
 
 			footprint_solid += cyl_solid
@@ -180,12 +196,39 @@ def convex_hull(vertices):
 	hull = MultiPoint(vertices).convex_hull
 	return get_shapely_exterior_array(hull)
 
+def key_table(keys):
+	if isinstance(keys, KeyTable):
+		return keys
+	return KeyTable.from_keys(keys)
+
+def key_arrays(keys):
+	return key_table(keys).arrays()
+
+def compute_keys_corners(x, y, width, height, rotation_angle, rotation_x, rotation_y):
+	# (N,4,2) corners in the same order as compute_key_corners:
+	# bottom left, bottom right, top right, top left
+	x_in = x[:, None] + width[:, None] * np.array([0, 1, 1, 0])
+	y_in = y[:, None] + height[:, None] * np.array([0, 0, 1, 1])
+
+	rot_rad = np.deg2rad(rotation_angle)[:, None]
+	cos = np.cos(rot_rad)
+	sin = np.sin(rot_rad)
+
+	offset_x = x_in - rotation_x[:, None]
+	offset_y = y_in - rotation_y[:, None]
+
+	corners = np.empty((len(x), 4, 2))
+	corners[:, :, 0] = offset_x * cos - offset_y * sin + rotation_x[:, None]
+	corners[:, :, 1] = offset_x * sin + offset_y * cos + rotation_y[:, None]
+
+	return corners
+
 def key_list_corners(keys):
-	key_corners = np.empty((0, 2))
-	for k in keys:
-		corners = np.array(compute_key_corners(k))
-		key_corners = np.append(key_corners, corners, axis=0)
-	return key_corners
+	if len(keys) == 0:
+		return np.empty((0, 2))
+
+	key_corners = compute_keys_corners(*key_arrays(keys))
+	return key_corners.reshape(-1, 2)
 
 def combine_polygon_verts(*args):
 	polygons = [ShapelyPolygon(verts) for verts in args]
@@ -195,6 +238,21 @@ def combine_polygon_verts(*args):
 def get_shapely_exterior_array(polygon):
 	return np.stack(polygon.exterior.xy, axis=1)
 
+def geometry_to_polygon(geometry):
+	# shapely (multi)polygon as one SolidPython polygon, every ring a path. OpenSCAD fills
+	# paths even-odd, so holes and disjoint parts need no boolean. None when empty
+	points, paths = [], []
+	for part in getattr(geometry, 'geoms', [geometry]):
+		if part.is_empty or part.geom_type != 'Polygon':
+			continue
+		for ring in [part.exterior, *part.interiors]:
+			ring_points = array2tuples(np.asarray(ring.coords)[:-1])
+			paths.append(list(range(len(points), len(points) + len(ring_points))))
+			points += ring_points
+	if not paths:
+		return None
+	return polygon(points, paths) if len(paths) > 1 else polygon(points)
+
 def array2tuples(verts):
 	tuples = []
 	for row in verts:
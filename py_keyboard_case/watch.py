@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import signal
+import time
+
+
+def snapshot(paths):
+	stamps = []
+	for path in paths:
+		try:
+			stat = os.stat(path)
+			stamps.append((stat.st_mtime_ns, stat.st_size))
+		except FileNotFoundError:
+			# mid save, editors often replace the file
+			stamps.append(None)
+	return tuple(stamps)
+
+def _run_in_group(target, args):
+	# own process group, so cancelling also stops renderer processes started by the build
+	if hasattr(os, 'setpgrp'):
+		os.setpgrp()
+	target(*args)
+
+def _start(target, args):
+	process = multiprocessing.Process(target=_run_in_group, args=(target, args))
+	process.start()
+	if hasattr(os, 'setpgid'):
+		# the child may not have run setpgrp yet, a cancel right away would find no group
+		try:
+			os.setpgid(process.pid, process.pid)
+		except OSError:
+			# already in its own group, or already gone
+			pass
+	return process
+
+def _cancel(process):
+	if hasattr(os, 'killpg'):
+		try:
+			os.killpg(process.pid, signal.SIGTERM)
+		except ProcessLookupError:
+			# no group to signal, stop the child itself rather than wait for the whole build
+			process.terminate()
+	else:
+		process.terminate()
+	process.join()
+
+def watch(paths, target, args=(), debounce=0.3, poll_interval=0.1):
+	# run target(*args) in a child process whenever one of `paths` changes. Changes are debounced,
+	# and a build still running when a newer change arrives is killed so the latest edit wins
+	process = None
+	last = snapshot(paths)
+	pending_since = time.monotonic()
+	build_start = None
+
+	try:
+		while True:
+			now = time.monotonic()
+			current = snapshot(paths)
+			if current != last:
+				last = current
+				pending_since = now
+				if process is not None and process.is_alive():
+					_cancel(process)
+					print(f"cancelled build after {now - build_start:.2f}s, inputs changed", flush=True)
+					process = None
+
+			if pending_since is not None and now - pending_since >= debounce and None not in current:
+				pending_since = None
+				build_start = now
+				process = _start(target, args)
+
+			if process is not None and not process.is_alive():
+				status = "done" if process.exitcode == 0 else f"failed ({process.exitcode})"
+				print(f"build {status} in {time.monotonic() - build_start:.2f}s, watching {', '.join(paths)}", flush=True)
+				process = None
+
+			time.sleep(poll_interval)
+	finally:
+		if process is not None and process.is_alive():
+			_cancel(process)
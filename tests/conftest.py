@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from py_keyboard_case.key_table import KeyTable
+from py_keyboard_case.housing import Housing
+from py_keyboard_case.redox import BertoDoxPort, gen_key_midpoint_screw_point_location, redox_tight_square_elec_compartment_polygon
+from py_keyboard_case.scad import UnionCollector
+from py_keyboard_case.utils import key_plate_footprint, key_plate_footprint_dual_acrylic_solid
+
+
+@pytest.fixture
+def redox_housing():
+	# builds the redox housing the way layout_to_case.py does, kwargs override Housing parameters
+	with open(os.path.join(ROOT, "kle_layouts", "redox.json"), 'r') as f:
+		keys = KeyTable.from_kle(f.read())
+	footprints = UnionCollector()
+	for key in keys:
+		footprints += key_plate_footprint(key, footprint_fn=key_plate_footprint_dual_acrylic_solid)
+	keys_filtered = keys[keys.x < 10]
+
+	def build(**kwargs):
+		params = dict(cavity_depth=4*3.175, plate_thickness=4.7625, port=BertoDoxPort(),
+			aux_screw_points=[gen_key_midpoint_screw_point_location(keys_filtered[keys_filtered.rotation_angle == 0])])
+		params.update(kwargs)
+		return Housing(redox_tight_square_elec_compartment_polygon(keys_filtered), footprints.get_solid(), **params)
+	return build
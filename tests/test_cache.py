@@ -0,0 +1,21 @@
+import os
+
+from py_keyboard_case.cache import ArtifactCache
+
+
+def test_fetch_leaves_matching_output_alone(tmp_path):
+	cache = ArtifactCache(str(tmp_path / "cache"))
+	source = tmp_path / "render.stl"
+	source.write_bytes(b"solid")
+	cache.put("ab12", ".stl", str(source))
+
+	output = tmp_path / "out.stl"
+	assert cache.fetch("ab12", ".stl", str(output))
+	os.utime(output, (0, 0))
+	assert cache.fetch("ab12", ".stl", str(output))
+	assert os.stat(output).st_mtime == 0
+
+	output.write_bytes(b"stale")
+	assert cache.fetch("ab12", ".stl", str(output))
+	assert output.read_bytes() == b"solid"
+	assert not cache.fetch("cd34", ".stl", str(output))
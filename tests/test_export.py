@@ -0,0 +1,19 @@
+import os
+
+from shapely.geometry import box
+
+from py_keyboard_case.export import laser_write_layers
+from py_keyboard_case.layers import LayeredSolid
+
+
+def test_laser_layers_remove_files_no_longer_written(tmp_path):
+	layers = LayeredSolid.extrude(box(0, 0, 10, 10), 0, 2)
+	# another part whose name starts the same is left alone
+	(tmp_path / "laser_case_top_0.svg").write_text("other")
+
+	laser_write_layers(layers, str(tmp_path), "case", [1, 1])
+	assert len(os.listdir(tmp_path)) == 5
+
+	# both layers are the same, only the first of the group is cut now
+	laser_write_layers(layers, str(tmp_path), "case", [1, 1], groups=[[0, 1]])
+	assert sorted(os.listdir(tmp_path)) == ["laser_case_0.dxf", "laser_case_0.svg", "laser_case_top_0.svg"]
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+import shapely
+
+from py_keyboard_case.screws import M2Standoff
+
+
+def gaps_along(ring, points):
+	# distances between neighbouring points, projected onto the ring, the last wrapping round to the first
+	positions = np.sort(ring.project(shapely.points(points)))
+	return np.diff(np.append(positions, positions[0] + ring.length))
+
+def test_screw_points_respect_max_spacing(redox_housing):
+	housing = redox_housing(screw_min_spacing=19, screw_max_spacing=40)
+	ring = housing.midline_polygon.exterior
+
+	# a fixed screw just past the point that ends the widest gap merges that point away,
+	# the gap has to be spaced out again
+	points = housing.get_screw_points()
+	positions = np.sort(ring.project(shapely.points(points)))
+	gaps = gaps_along(ring, points)
+	widest = np.argmax(np.roll(gaps, 1))
+	fixed = ring.interpolate((positions[widest] + 0.9 * 19) % ring.length).coords[0]
+
+	assert gaps_along(ring, housing.get_screw_points([fixed])).max() <= 40 + 1e-9
+
+@pytest.mark.parametrize('max_spacing', [40, 60, 80])
+def test_interior_aux_screw_is_not_a_perimeter_screw(redox_housing, max_spacing):
+	# the redox mid board aux screw is 40mm inside the ring, it must not stand in for a perimeter one
+	housing = redox_housing(screw_min_spacing=10, screw_max_spacing=max_spacing)
+	ring = housing.midline_polygon.exterior
+	points = np.array([screw.position[:2] for screw in housing.screws if isinstance(screw, M2Standoff)])
+	distance = ring.distance(shapely.points(points))
+
+	assert (distance > 40).sum() == 1
+	assert gaps_along(ring, points[distance < 1e-6]).max() <= max_spacing + 1e-9
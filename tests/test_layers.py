@@ -0,0 +1,31 @@
+from solid import cube, cylinder, hole, linear_extrude, square
+from solid.utils import up
+
+from py_keyboard_case.layers import solid_to_layers
+
+
+def slab_summary(layers):
+	return [(slab.z_min, slab.z_max, round(slab.geometry.area, 6)) for slab in layers.slabs]
+
+def test_slab_heights():
+	# a pocket in the middle of a block splits it into three slabs, the extrusion on top adds a fourth
+	solid = cube([10, 10, 4]) - up(1)(cube([2, 2, 2])) + up(4)(linear_extrude(2)(square(5)))
+	assert slab_summary(solid_to_layers(solid)) == [(0, 1, 100), (1, 3, 96), (3, 4, 100), (4, 6, 25)]
+
+def test_cylinder_and_hole():
+	cylinder_layers = solid_to_layers(up(-1)(cylinder(r=3, h=2, segments=4)))
+	assert slab_summary(cylinder_layers) == [(-1, 1, 18)]
+
+	# a hole is cut from everything it overlaps, a quarter of this one is inside the block
+	block = solid_to_layers(cube([10, 10, 2]) + hole()(cylinder(r=1, h=4, segments=4)))
+	assert slab_summary(block) == [(0, 2, 99.5)]
+
+def test_plate_solid_matches_plate_layers(redox_housing):
+	housing = redox_housing()
+	evaluated = solid_to_layers(housing.get_plate_solid(mode="laser"))
+	layers = housing.get_plate_layers(mode="laser")
+
+	assert [(slab.z_min, slab.z_max) for slab in evaluated.slabs] == [(0, 3.175), (3.175, 3.5625), (3.5625, 4.7625)]
+	assert [(slab.z_min, slab.z_max) for slab in layers.slabs] == [(slab.z_min, slab.z_max) for slab in evaluated.slabs]
+	for a, b in zip(evaluated.slabs, layers.slabs):
+		assert a.geometry.symmetric_difference(b.geometry).area < 1e-6
@@ -0,0 +1,39 @@
+from collections import Counter
+
+import numpy as np
+from shapely import affinity
+from shapely.geometry import box
+
+from py_keyboard_case.layers import LayeredSolid
+from py_keyboard_case.mesh import layers_to_mesh
+
+
+def unmatched_edges(mesh):
+	# directed edges of the mesh, at the float32 precision an STL stores, that are not used by
+	# exactly one triangle each way round. A closed manifold mesh has none
+	edges = Counter()
+	for triangle in np.asarray(mesh, dtype=np.float32):
+		vertices = [tuple(vertex) for vertex in triangle]
+		for i in range(3):
+			edges[vertices[i], vertices[(i + 1) % 3]] += 1
+	return [edge for edge, count in edges.items() if count != 1 or edges[edge[::-1]] != 1]
+
+def test_stepped_box():
+	layers = LayeredSolid.extrude(box(0, 0, 10, 10), 0, 1) + LayeredSolid.extrude(box(0, 0, 5, 10), 1, 2)
+	assert unmatched_edges(layers_to_mesh(layers)) == []
+
+def test_crossing_slabs():
+	layers = LayeredSolid.extrude(box(0, 0, 10, 10), 0, 1) + LayeredSolid.extrude(box(3, -2, 6, 4), 1, 2)
+	assert unmatched_edges(layers_to_mesh(layers)) == []
+
+def test_rotated_switch_hole():
+	# a plate with a support pocket under a smaller switch hole, neither lined up with the plate
+	support = affinity.rotate(box(40, 40, 60, 60), 30, origin=(50, 50))
+	switch = affinity.rotate(box(43, 43, 57, 57), 30, origin=(50, 50))
+	layers = LayeredSolid.extrude(box(0, 0, 100, 100), 0, 4.7) - (LayeredSolid.extrude(support, 0, 3) + LayeredSolid.extrude(switch, 3, 4.7))
+	assert unmatched_edges(layers_to_mesh(layers)) == []
+
+def test_redox_housing(redox_housing):
+	housing = redox_housing()
+	assert unmatched_edges(housing.get_case_mesh()) == []
+	assert unmatched_edges(housing.get_plate_mesh()) == []
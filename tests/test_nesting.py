@@ -0,0 +1,35 @@
+import os
+
+import pytest
+from shapely.geometry import Polygon, box
+
+from py_keyboard_case.nesting import fits_sheet, nest, nest_layers, write_sheets
+
+
+def test_write_sheets_removes_sheets_no_longer_written(tmp_path):
+	# two parts that only fit one per sheet, then one part
+	parts = [("a", 3, box(0, 0, 80, 80)), ("b", 3, box(0, 0, 80, 80))]
+	write_sheets(nest_layers(parts, (100, 100)), str(tmp_path), "sheet", (100, 100))
+	assert len(os.listdir(tmp_path)) == 5
+
+	write_sheets(nest_layers(parts[:1], (100, 100)), str(tmp_path), "sheet", (100, 100))
+	assert sorted(os.listdir(tmp_path)) == ["sheet.json", "sheet_0.dxf", "sheet_0.svg"]
+
+def test_fits_sheet_matches_nest():
+	sheet_size = (100, 50)
+	# only fits turned on its side
+	tall = box(0, 0, 30, 80)
+	assert fits_sheet(tall, sheet_size)
+	assert len(nest([("tall", tall)], sheet_size)) == 1
+	assert not fits_sheet(tall, sheet_size, rotations=(0,))
+
+	long = box(0, 0, 120, 10)
+	assert not fits_sheet(long, sheet_size)
+	with pytest.raises(ValueError):
+		nest([("long", long)], sheet_size)
+
+def test_empty_part_fits_and_is_skipped():
+	# e.g. a plate layer above a thinner plate
+	empty = Polygon()
+	assert fits_sheet(empty, (100, 50))
+	assert nest([("empty", empty), ("part", box(0, 0, 10, 10))], (100, 50))[0][0].label == "part"
@@ -0,0 +1,38 @@
+import time
+
+from py_keyboard_case.render import render_artifacts
+
+
+def script(path, body):
+	# the renderer command is the input itself, so each input decides how its render goes
+	path.write_text("#!/bin/sh\n" + body)
+	path.chmod(0o755)
+	return str(path)
+
+def test_killed_render_is_cancelled(tmp_path):
+	started = tmp_path / "started"
+	slow = script(tmp_path / "slow.scad", f"touch {started}\nexec sleep 5\n")
+	failing = script(tmp_path / "failing.scad", f"while [ ! -e {started} ]; do sleep 0.01; done\nexit 2\n")
+
+	results = render_artifacts([slow, failing], command="{input}", jobs=2, output_dir=str(tmp_path))
+	assert [(result.returncode, result.stderr) for result in results] == [(None, "cancelled"), (2, "")]
+
+def test_failure_after_stop_is_not_cancelled(tmp_path):
+	# the slow render fails on its own after the broken one stopped the pool, nothing killed it
+	started = tmp_path / "started"
+	slow = script(tmp_path / "slow.scad", f"touch {started}\nsleep 0.2\nexit 3\n")
+	broken = tmp_path / "broken.scad"
+	broken.write_text("not executable")
+
+	class WaitForSlow:
+		# holds the broken render back until the slow one is running
+		def fetch(self, key, ext, destination):
+			while destination.endswith("broken.stl") and not started.exists():
+				time.sleep(0.01)
+			return False
+
+		def put(self, key, ext, source):
+			pass
+
+	results = render_artifacts([slow, str(broken)], command="{input}", jobs=2, output_dir=str(tmp_path), cache=WaitForSlow())
+	assert [result.returncode for result in results] == [3, -1]
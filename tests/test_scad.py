@@ -0,0 +1,75 @@
+import gzip
+import io
+import re
+
+from solid import cube, cylinder, scad_render, sphere, translate, union
+
+from py_keyboard_case.layers import solid_to_layers
+from py_keyboard_case.scad import flatten_unions, scad_render_modules, stream_render, write_solid
+
+
+def same_layers(a, b):
+	return len(a.slabs) == len(b.slabs) and all(
+		(x.z_min, x.z_max) == (y.z_min, y.z_max) and x.geometry.equals(y.geometry) for x, y in zip(a.slabs, b.slabs))
+
+def expand_modules(text):
+	# scad_render_modules output with every module call replaced by the module body
+	definition = re.compile(r"\nmodule (m_\w+)\(\) \{(.*?)\n\}\n", re.S)
+	modules = dict(definition.findall(text))
+	text = definition.sub("", text)
+	call = re.compile(r"(m_\w+)\(\);")
+	while call.search(text):
+		text = call.sub(lambda match: modules[match.group(1)], text)
+	return text
+
+def normalize(text):
+	# without whitespace and empty groups, which render nothing. The hole section of an inline
+	# render wraps paths that end up with no holes in them
+	text = re.sub(r"\s", "", text)
+	empty = re.compile(r"\w+\([^(){}]*\)\{\}")
+	while empty.search(text):
+		text = empty.sub("", text)
+	return text
+
+def test_flatten_unions_folds_nested_unions():
+	tree = union()(cube(1), union()(union()(sphere(1), cylinder(r=1, h=2)), translate([1, 0, 0])(union()(cube(2), union()(cube(3))))))
+	before = scad_render(tree)
+
+	flat = flatten_unions(tree)
+	assert scad_render(flat) == scad_render(union()(cube(1), sphere(1), cylinder(r=1, h=2), translate([1, 0, 0])(union()(cube(2), cube(3)))))
+	assert scad_render(tree) == before
+
+def test_flatten_unions_keeps_the_solid(redox_housing):
+	housing = redox_housing()
+	for solid in [housing.get_case_solid(mode="laser"), housing.get_blown_up_solid()]:
+		before = scad_render(solid)
+		flat = flatten_unions(solid)
+		assert same_layers(solid_to_layers(flat), solid_to_layers(solid))
+		assert scad_render(solid) == before
+
+def test_modules_expand_to_the_inline_render(redox_housing):
+	housing = redox_housing()
+	for solid in [housing.get_case_solid(), housing.get_plate_solid(), housing.get_blown_up_solid()]:
+		before = scad_render(solid)
+		text = scad_render_modules(solid)
+		assert "\nmodule " in text
+		assert normalize(expand_modules(text)) == normalize(scad_render(flatten_unions(solid)))
+		# the module calls swapped into the tree are taken out again
+		assert scad_render(solid) == before
+
+def test_stream_render_matches_scad_render(redox_housing, tmp_path):
+	housing = redox_housing()
+	for solid in [housing.get_case_solid(), housing.get_plate_solid(mode="laser"), housing.get_blown_up_solid()]:
+		before = scad_render(solid)
+		out = io.StringIO()
+		stream_render(solid, out, file_header="// header")
+		assert out.getvalue() == scad_render(solid, file_header="// header")
+		assert scad_render(solid) == before
+
+		# written flattened, compressed or not
+		expected = scad_render(flatten_unions(solid)).encode()
+		write_solid(str(tmp_path / "a.scad"), solid)
+		assert (tmp_path / "a.scad").read_bytes() == expected
+		write_solid(str(tmp_path / "a.scad.gz"), solid)
+		assert gzip.decompress((tmp_path / "a.scad.gz").read_bytes()) == expected
+		assert scad_render(solid) == before
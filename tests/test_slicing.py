@@ -0,0 +1,27 @@
+from shapely.geometry import box
+
+from py_keyboard_case.layers import LayeredSolid
+from py_keyboard_case.pipeline import case_layer_thicknesses
+from py_keyboard_case.slicing import layer_groups
+
+
+def test_layer_groups():
+	block = LayeredSolid.extrude(box(0, 0, 10, 10), 0, 6)
+	assert layer_groups(block, [2, 2, 2]) == [[0, 1, 2]]
+	# same outline, different stock
+	assert layer_groups(block, [2, 2, 1]) == [[0, 1], [2]]
+
+	pocket = block - LayeredSolid.extrude(box(4, 4, 6, 6), 2, 4)
+	assert layer_groups(pocket, [2, 2, 2]) == [[0, 2], [1]]
+
+def test_layer_groups_ignore_slivers_at_faces():
+	# a step within the slicing jitter of a layer face does not make the layer different
+	stepped = LayeredSolid.extrude(box(0, 0, 10, 10), 0, 4) + LayeredSolid.extrude(box(0, 0, 12, 10), 3.995, 4)
+	assert layer_groups(stepped, [2, 2]) == [[0, 1]]
+	assert layer_groups(stepped, [2, 2], jitter_dist=0) == [[0], [1]]
+
+def test_redox_case_groups(redox_housing):
+	# no tilt mounts: the bottom layer, two cavity walls with the port cut and two without
+	housing = redox_housing()
+	layers = housing.get_case_layers(mode="laser", align="bottom")
+	assert layer_groups(layers, case_layer_thicknesses(housing)) == [[0], [1, 2], [3, 4]]
@@ -0,0 +1,15 @@
+import time
+
+from py_keyboard_case.watch import _cancel, _start
+
+
+def slow_build():
+	time.sleep(5)
+
+def test_cancel_right_after_start():
+	# the child may not have made its own process group yet
+	start = time.monotonic()
+	process = _start(slow_build, ())
+	_cancel(process)
+	assert time.monotonic() - start < 2
+	assert process.exitcode != 0